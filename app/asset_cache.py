@@ -0,0 +1,324 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.http import parse_http_date_safe
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_cache_control(value):
+    directives = {}
+    for directive in (value or '').split(','):
+        name, _, argument = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"') or True
+    return directives
+
+def freshness_lifetime(headers, now):
+    # RFC 9111 section 4.2.1, for a shared cache
+    cache_control = parse_cache_control(headers.get('Cache-Control'))
+    if 'no-cache' in cache_control:
+        return 0
+    for directive in ('s-maxage', 'max-age', ):
+        if directive in cache_control:
+            try:
+                return max(int(cache_control[directive]), 0)
+            except (TypeError, ValueError):
+                return 0
+
+    date = parse_http_date_safe(headers.get('Date') or '') or now
+    expires = headers.get('Expires')
+    if expires is not None:
+        expires = parse_http_date_safe(expires)
+        return max(expires - date, 0) if expires else 0
+
+    last_modified = parse_http_date_safe(headers.get('Last-Modified') or '')
+    if last_modified: # heuristic freshness, 10% of the age of the document
+        return min(max(date - last_modified, 0) // 10, settings.PROXY_ASSET_CACHE_MAX_HEURISTIC_AGE)
+    return 0
+
+def is_storable(status_code, headers):
+    cache_control = parse_cache_control(headers.get('Cache-Control'))
+    return (
+        status_code == 200
+        and 'no-store' not in cache_control
+        and 'private' not in cache_control
+    )
+
+
+class CachedAsset:
+    stored_headers = ('Content-Type', 'Content-Encoding', 'Cache-Control', 'Expires', 'ETag', 'Last-Modified', 'Date', )
+
+    def __init__(self, cache, url, digest, size, headers, fresh_until):
+        self.cache       = cache
+        self.url         = url
+        self.digest      = digest
+        self.size        = size
+        self.headers     = headers
+        self.fresh_until = fresh_until
+
+    @property
+    def path(self):
+        return self.cache.object_path(self.digest)
+
+    @property
+    def etag(self): # browser facing etag, the content hash
+        return f'"{self.digest}"'
+
+    def is_fresh(self):
+        return time.time() < self.fresh_until
+
+    def revalidation_headers(self):
+        headers = {}
+        if self.headers.get('ETag'):
+            headers['If-None-Match'] = self.headers['ETag']
+        if self.headers.get('Last-Modified'):
+            headers['If-Modified-Since'] = self.headers['Last-Modified']
+        return headers
+
+    def open(self):
+        return open(self.path, 'rb')
+
+    def to_dict(self):
+        return {
+            'url':         self.url,
+            'digest':      self.digest,
+            'size':        self.size,
+            'headers':     self.headers,
+            'fresh_until': self.fresh_until,
+        }
+
+
+class AssetWriter:
+    def __init__(self, cache, url, headers, expected_size):
+        self.cache         = cache
+        self.url           = url
+        self.headers       = headers
+        self.expected_size = expected_size
+        self.size          = 0
+        self.body_hash     = hashlib.sha256()
+        fd, self.tmp_path  = tempfile.mkstemp(dir=cache.root / 'tmp')
+        self.file          = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        if self.file is None:
+            return
+        self.size += len(chunk)
+        if self.size > self.cache.max_object_bytes:
+            self.abort()
+            return
+        self.file.write(chunk)
+        self.body_hash.update(chunk)
+
+    def commit(self):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        if self.expected_size is None or self.expected_size == self.size:
+            self.cache._commit(self.url, self.headers, self.tmp_path, self.body_hash.hexdigest(), self.size)
+
+    def abort(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class AssetCache:
+    """
+    Content addressed store of upstream assets on disk.
+
+    Bodies live in objects/<sha256 of body>, so equal files fetched from
+    different urls are stored once. Every url has a small json entry in
+    index/<sha256 of url>.json with the upstream headers needed for
+    freshness checks and revalidation. The mtime of an index entry is its
+    last use, entries are evicted least recently used first once the
+    objects take more than `max_bytes`.
+    """
+
+    def __init__(self, root, max_bytes, max_object_bytes):
+        self.root             = Path(root)
+        self.max_bytes        = max_bytes
+        self.max_object_bytes = max_object_bytes
+        self._size            = None # approximate size of objects/, scanned on first store
+        self._lock            = threading.Lock()
+        for directory in ('objects', 'index', 'tmp', ):
+            (self.root / directory).mkdir(parents=True, exist_ok=True)
+
+    def object_path(self, digest):
+        return self.root / 'objects' / digest[:2] / digest
+
+    def index_path(self, url):
+        url_digest = hashlib.sha256(url.encode()).hexdigest()
+        return self.root / 'index' / url_digest[:2] / f'{url_digest}.json'
+
+    def lookup(self, url, touch=True):
+        index_path = self.index_path(url)
+        try:
+            with open(index_path) as index_file:
+                entry = CachedAsset(self, **json.load(index_file))
+            if touch:
+                os.utime(index_path) # mark as recently used
+        except (OSError, ValueError, TypeError):
+            return None
+        if not entry.path.exists():
+            return None
+        return entry
+
+    def _write_index(self, entry):
+        index_path = self.index_path(entry.url)
+        index_path.parent.mkdir(exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root / 'tmp')
+        with os.fdopen(fd, 'w') as index_file:
+            json.dump(entry.to_dict(), index_file)
+        os.replace(tmp_path, index_path)
+
+    def _entry_headers(self, headers):
+        return {
+            header: headers[header]
+            for header in CachedAsset.stored_headers
+            if headers.get(header)
+        }
+
+    def refresh(self, entry, headers):
+        # upstream answered 304, keep the body and take the new validators
+        entry.headers.update(self._entry_headers(headers))
+        entry.fresh_until = time.time() + freshness_lifetime(entry.headers, time.time())
+        self._write_index(entry)
+        return entry
+
+    def writer(self, url, status_code, headers):
+        if not is_storable(status_code, headers):
+            return None
+        expected_size = headers.get('Content-Length')
+        expected_size = int(expected_size) if expected_size and expected_size.isdigit() else None
+        if expected_size is not None and expected_size > self.max_object_bytes:
+            return None
+        return AssetWriter(self, url, headers, expected_size)
+
+    def store_stream(self, url, status_code, headers, chunks):
+        """
+        Pass `chunks` through while writing them to the cache. The entry
+        is only committed when the body was read to the end.
+        """
+        writer = self.writer(url, status_code, headers)
+        if writer is None:
+            yield from chunks
+            return
+        try:
+            for chunk in chunks:
+                writer.write(chunk)
+                yield chunk
+            writer.commit()
+        finally:
+            writer.abort()
+
+    async def astore_stream(self, url, status_code, headers, chunks):
+        # the same, with the file work in worker threads: commit() may scan and evict the whole cache
+        writer = await sync_to_async(self.writer, thread_sensitive=False)(url, status_code, headers)
+        if writer is None:
+            async for chunk in chunks:
+                yield chunk
+            return
+        try:
+            async for chunk in chunks:
+                await sync_to_async(writer.write, thread_sensitive=False)(chunk)
+                yield chunk
+            await sync_to_async(writer.commit, thread_sensitive=False)()
+        finally:
+            await sync_to_async(writer.abort, thread_sensitive=False)()
+
+    def _commit(self, url, headers, tmp_path, digest, size):
+        object_path = self.object_path(digest)
+        object_path.parent.mkdir(exist_ok=True)
+        if object_path.exists(): # same body is already stored for another url
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, object_path)
+            self._add_size(size)
+
+        entry_headers = self._entry_headers(headers)
+        now = time.time()
+        entry = CachedAsset(self, url, digest, size, entry_headers, now + freshness_lifetime(entry_headers, now))
+        self._write_index(entry)
+
+    def _add_size(self, size):
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += size
+            over_quota = self._size > self.max_bytes
+        if over_quota:
+            self.evict()
+
+    def _scan_size(self):
+        return sum(
+            path.stat().st_size
+            for path in (self.root / 'objects').glob('*/*')
+        )
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for index_path in (self.root / 'index').glob('*/*.json'):
+                try:
+                    with open(index_path) as index_file:
+                        digest = json.load(index_file)['digest']
+                    entries.append((index_path.stat().st_mtime, index_path, digest))
+                except (OSError, ValueError, KeyError):
+                    continue
+            entries.sort()
+
+            references = {}
+            for _, _, digest in entries:
+                references[digest] = references.get(digest, 0) + 1
+
+            sizes = {}
+            for object_path in (self.root / 'objects').glob('*/*'):
+                if object_path.name not in references: # orphaned body
+                    object_path.unlink(missing_ok=True)
+                else:
+                    sizes[object_path.name] = object_path.stat().st_size
+
+            total_size = sum(sizes.values())
+            low_watermark = self.max_bytes * 0.9
+            for _, index_path, digest in entries:
+                if total_size <= low_watermark:
+                    break
+                index_path.unlink(missing_ok=True)
+                references[digest] -= 1
+                if not references[digest] and digest in sizes:
+                    self.object_path(digest).unlink(missing_ok=True)
+                    total_size -= sizes.pop(digest)
+            self._size = total_size
+            logger.info('Asset cache evicted down to %s bytes', total_size)
+
+
+_asset_cache      = None
+_asset_cache_lock = threading.Lock()
+
+
+def get_asset_cache():
+    global _asset_cache
+    if not settings.PROXY_ASSET_CACHE_ENABLED:
+        return None
+    with _asset_cache_lock:
+        if _asset_cache is None:
+            _asset_cache = AssetCache(
+                root=settings.PROXY_ASSET_CACHE_DIR,
+                max_bytes=settings.PROXY_ASSET_CACHE_MAX_BYTES,
+                max_object_bytes=settings.PROXY_ASSET_CACHE_MAX_OBJECT_BYTES,
+            )
+    return _asset_cache
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core import signing
+
+
+SALT        = 'app.asset_pass'
+COOKIE_PATH = '/static_proxy/'
+
+
+def asset_pass_user_id(request, max_age=None):
+    """
+    Id of the user the asset pass cookie of `request` was issued to, None
+    without a valid one. Only the signature is checked, no database.
+    """
+    value = request.COOKIES.get(settings.PROXY_ASSET_PASS_COOKIE)
+    if not value:
+        return None
+    try:
+        return signing.TimestampSigner(salt=SALT).unsign(value, max_age=max_age or settings.PROXY_ASSET_PASS_TTL)
+    except signing.BadSignature: # expired ones included
+        return None
+
+def issue_asset_pass(request, response):
+    # for the logged in user, again once the one the browser has is half way to expiry
+    user_id = str(request.user.pk)
+    if asset_pass_user_id(request, max_age=settings.PROXY_ASSET_PASS_TTL / 2) == user_id:
+        return response
+    response.set_cookie(
+        settings.PROXY_ASSET_PASS_COOKIE,
+        signing.TimestampSigner(salt=SALT).sign(user_id),
+        max_age=settings.PROXY_ASSET_PASS_TTL,
+        path=COOKIE_PATH,
+        secure=request.is_secure(),
+        httponly=True,
+        samesite='Lax',
+    )
+    return response
+
+def revoke_asset_pass(response):
+    response.delete_cookie(settings.PROXY_ASSET_PASS_COOKIE, path=COOKIE_PATH, samesite='Lax')
+    return response
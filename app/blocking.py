@@ -0,0 +1,48 @@
+from django.conf import settings
+
+from app.asset_cache import get_asset_cache
+
+
+RESOURCE_EXTENSIONS = {
+    'images': ('png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'svg', 'ico', 'bmp', ),
+    'media':  ('mp4', 'webm', 'ogg', 'ogv', 'mp3', 'wav', 'm4a', 'mov', 'm3u8', ),
+    'fonts':  ('woff', 'woff2', 'ttf', 'otf', 'eot', ),
+}
+
+
+def extension_patterns(extensions):
+    # Network.setBlockedURLs matches whole urls, so also cover query strings
+    patterns = []
+    for extension in extensions:
+        patterns += [f'*.{extension}', f'*.{extension}?*']
+    return patterns
+
+def domain_patterns(domains):
+    return [f'*://{domain}/*' for domain in domains] + [f'*.{domain}/*' for domain in domains]
+
+def blocked_url_patterns(site):
+    """
+    Url patterns Chrome must not load while rendering pages of `site`.
+    Network.setBlockedURLs has no notion of resource types, so they are
+    matched by file extension.
+    """
+    patterns = []
+    for resource, extensions in RESOURCE_EXTENSIONS.items():
+        if getattr(site, f'block_{resource}'):
+            patterns += extension_patterns(extensions)
+    if site.block_trackers:
+        patterns += domain_patterns(settings.PROXY_BLOCKED_TRACKER_DOMAINS)
+    patterns += [pattern.strip() for pattern in site.blocked_urls.splitlines() if pattern.strip()]
+    return patterns
+
+def estimate_saved_bytes(urls):
+    # sizes are only known for assets the static proxy has cached before
+    asset_cache = get_asset_cache()
+    if asset_cache is None:
+        return 0
+    saved_bytes = 0
+    for url in urls:
+        cached_asset = asset_cache.lookup(url, touch=False)
+        if cached_asset:
+            saved_bytes += cached_asset.size
+    return saved_bytes
@@ -0,0 +1,52 @@
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _url_digest(url):
+    return hashlib.sha1(url.encode()).hexdigest()
+
+def _site_version_key(site_id):
+    return f'proxy:site_version:{site_id}'
+
+def get_site_version(site_id):
+    # random token instead of a counter, so an evicted version key can never
+    # bring back entries that were rendered before an invalidation
+    key = _site_version_key(site_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+def invalidate_site(site_id):
+    cache.set(_site_version_key(site_id), uuid.uuid4().hex, timeout=None)
+
+def _page_key(site_id, url):
+    return f'proxy:page:{site_id}:{get_site_version(site_id)}:{_url_digest(url)}'
+
+def get_rendered_page(site_id, url):
+    return cache.get(_page_key(site_id, url))
+
+def set_rendered_page(site_id, url, html_content):
+    cache.set(_page_key(site_id, url), html_content, timeout=settings.PROXY_PAGE_CACHE_TTL)
+
+def _css_key(name, url):
+    return f'proxy:css:{name}:{_url_digest(url)}'
+
+def get_rewritten_css(name, url):
+    return cache.get(_css_key(name, url))
+
+def set_rewritten_css(name, url, content):
+    cache.set(_css_key(name, url), content, timeout=settings.PROXY_CSS_CACHE_TTL)
+
+def _compressed_key(encoding, content_digest):
+    return f'proxy:compressed:{encoding}:{content_digest}'
+
+def get_compressed(encoding, content_digest):
+    return cache.get(_compressed_key(encoding, content_digest))
+
+def set_compressed(encoding, content_digest, body, timeout):
+    cache.set(_compressed_key(encoding, content_digest), body, timeout=timeout)
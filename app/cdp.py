@@ -0,0 +1,72 @@
+import json
+import time
+
+
+class NetworkCollector:
+    """
+    Incremental reader of the CDP performance log of a Chrome session.
+
+    Only network events are logged (see build_chrome_options) and only the
+    ones listed in `events` are parsed, every other entry is dropped with a
+    substring check. `drain()` consumes what the browser logged since the
+    previous call and is called on every readiness poll, so at most one
+    poll interval of entries is held at a time. Entries logged before the
+    collector was made, by the previous render of the session, are skipped.
+    Of Network.responseReceived only the first one for a document is
+    parsed, for the status of the page.
+    """
+
+    events = ('Network.requestWillBeSent', 'Network.loadingFinished', 'Network.loadingFailed', )
+
+    def __init__(self, driver):
+        self.driver          = driver
+        self.routed_bytes    = 0     # encoded (on the wire) body and header bytes of finished requests
+        self.in_flight       = {}    # request id -> url, of requests without a response body yet
+        self.requests        = 0
+        self.blocked         = []    # urls of requests blocked by Network.setBlockedURLs
+        self.document_status = None  # http status of the page, of the first document response
+        self.last_activity   = time.monotonic()
+        self.since           = time.time() * 1000 # log entry timestamps are epoch milliseconds
+
+    def drain(self):
+        for entry in self.driver.get_log('performance'):
+            message = entry['message']
+            if entry['timestamp'] < self.since or not self.wanted(message):
+                continue
+            event = json.loads(message)['message']
+            handler = getattr(self, 'on_' + event['method'].replace('.', '_'), None)
+            if handler:
+                handler(event['params'])
+                self.last_activity = time.monotonic()
+
+    def wanted(self, message):
+        if any(event in message for event in self.events):
+            return True
+        return (
+            self.document_status is None
+            and '"Network.responseReceived"' in message and '"Document"' in message
+        )
+
+    def idle_for(self):
+        # seconds without in-flight requests, 0 while any is pending
+        if self.in_flight:
+            return 0
+        return time.monotonic() - self.last_activity
+
+    def on_Network_requestWillBeSent(self, params):
+        if params['requestId'] not in self.in_flight: # redirects reuse the request id
+            self.requests += 1
+        self.in_flight[params['requestId']] = params['request']['url']
+
+    def on_Network_responseReceived(self, params):
+        if self.document_status is None and params.get('type') == 'Document':
+            self.document_status = params['response']['status']
+
+    def on_Network_loadingFinished(self, params):
+        self.in_flight.pop(params['requestId'], None)
+        self.routed_bytes += int(params.get('encodedDataLength') or 0)
+
+    def on_Network_loadingFailed(self, params):
+        url = self.in_flight.pop(params['requestId'], None)
+        if params.get('blockedReason') and url:
+            self.blocked.append(url)
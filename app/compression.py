@@ -0,0 +1,121 @@
+import hashlib
+import zlib
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from app.cache import get_compressed, set_compressed
+from app.metrics import cache_result
+
+try:
+    import brotli
+except ImportError: # gzip only
+    brotli = None
+
+
+def supported_encodings():
+    return ('br', 'gzip', ) if brotli else ('gzip', )
+
+def negotiate(accept_encoding):
+    """
+    Best of the supported encodings the client accepts, None for identity.
+    Brotli is preferred over gzip at equal quality.
+    """
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        encoding, _, params = item.partition(';')
+        params = params.strip()
+        quality = 1.0
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0
+        accepted[encoding.strip().lower()] = quality
+
+    quality, _, encoding = max(
+        (accepted.get(encoding, accepted.get('*', 0)), -index, encoding)
+        for index, encoding in enumerate(supported_encodings())
+    )
+    return encoding if quality > 0 else None
+
+
+class StreamCompressor:
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self.compressor = brotli.Compressor(quality=settings.PROXY_BROTLI_QUALITY)
+            self._compress  = self.compressor.process
+            self._finish    = self.compressor.finish
+        else:
+            self.compressor = zlib.compressobj(settings.PROXY_GZIP_LEVEL, zlib.DEFLATED, 31) # 31: gzip container
+            self._compress  = self.compressor.compress
+            self._finish    = self.compressor.flush
+
+    def compress(self, data):
+        return self._compress(data)
+
+    def finish(self):
+        return self._finish()
+
+
+def compress(data, encoding):
+    compressor = StreamCompressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+def compress_chunks(chunks, encoding):
+    compressor = StreamCompressor(encoding)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.finish()
+
+async def acompress_chunks(chunks, encoding):
+    compressor = StreamCompressor(encoding)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.finish()
+
+def cached_compress(data, encoding, timeout):
+    """
+    Compressed `data`, from the cache when the same content was compressed
+    before. Variants are keyed by the content hash, so they never go stale
+    and a re-rendered page gets new ones.
+    """
+    digest = hashlib.sha1(data).hexdigest()
+    body = get_compressed(encoding, digest)
+    cache_result(f'compressed_{encoding}', body is not None)
+    if body is None:
+        body = compress(data, encoding)
+        set_compressed(encoding, digest, body, timeout)
+    return body
+
+def text_response(request, content, timeout, **kwargs):
+    """
+    HttpResponse with `content`, compressed for the client if it is large
+    enough to be worth it.
+    """
+    data = content.encode() if isinstance(content, str) else content
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    if encoding and len(data) >= settings.PROXY_COMPRESS_MIN_BYTES:
+        response = HttpResponse(cached_compress(data, encoding, timeout), **kwargs)
+        response['Content-Encoding'] = encoding
+    else:
+        response = HttpResponse(data, **kwargs)
+    patch_vary_headers(response, ('Accept-Encoding', ))
+    return response
+
+def compress_streaming_response(request, response):
+    # for generated text streamed as it is produced, its size is not known up front
+    encoding = negotiate(request.headers.get('Accept-Encoding'))
+    if encoding:
+        if response.is_async:
+            response.streaming_content = acompress_chunks(response.streaming_content, encoding)
+        else:
+            response.streaming_content = compress_chunks(response.streaming_content, encoding)
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding', ))
+    return response
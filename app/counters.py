@@ -0,0 +1,100 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import F
+
+from app.metrics import upstream_bytes_total
+from app.models import Site
+
+
+logger = logging.getLogger(__name__)
+
+
+class TrafficCounter:
+    """
+    Write-behind buffer of Site.visit_count and Site.routed_data_amount
+    increments.
+
+    Increments are summed per site in memory and written every
+    `flush_interval` seconds by a background thread, one
+    `UPDATE ... SET x = x + n WHERE id IN (...)` (or `name IN`) per
+    distinct pair of increments. Failed writes are put back into the
+    buffer, and the buffer is flushed once more when the process exits.
+    """
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self._pending       = {} # (site lookup field, value) -> [visits, routed bytes]
+        self._lock          = threading.Lock()
+        self._flush_lock    = threading.Lock()
+        self._stopped       = threading.Event()
+        self._flusher       = None
+
+    def add(self, site_id=None, visits=0, routed_bytes=0, site_name=None):
+        # sites are addressed by id, or by name where the id is not at hand
+        if not visits and not routed_bytes:
+            return
+        key = ('id', site_id) if site_id is not None else ('name', site_name)
+        with self._lock:
+            counts = self._pending.setdefault(key, [0, 0])
+            counts[0] += visits
+            counts[1] += routed_bytes
+        if self.flush_interval <= 0:
+            self.flush()
+        else:
+            self._start_flusher()
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, name='traffic-counter', daemon=True)
+                self._flusher.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+            close_old_connections() # this thread keeps its own db connection
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+
+            batches = defaultdict(list)
+            for (lookup, value), (visits, routed_bytes) in pending.items():
+                batches[(lookup, visits, routed_bytes)].append(value)
+            try:
+                with transaction.atomic():
+                    for (lookup, visits, routed_bytes), values in batches.items():
+                        Site.objects.filter(**{f'{lookup}__in': values}).update(
+                            visit_count=F('visit_count') + visits,
+                            routed_data_amount=F('routed_data_amount') + routed_bytes,
+                        )
+            except DatabaseError:
+                logger.exception('Failed to flush traffic counters, will retry')
+                for key, (visits, routed_bytes) in pending.items():
+                    with self._lock:
+                        counts = self._pending.setdefault(key, [0, 0])
+                        counts[0] += visits
+                        counts[1] += routed_bytes
+
+    def stop(self):
+        self._stopped.set()
+        self.flush()
+
+
+traffic_counter = TrafficCounter(flush_interval=settings.PROXY_COUNTER_FLUSH_INTERVAL)
+atexit.register(traffic_counter.stop)
+
+
+def count_traffic(site_id=None, visits=0, routed_bytes=0, site_name=None):
+    upstream_bytes_total.inc(routed_bytes)
+    traffic_counter.add(site_id, visits=visits, routed_bytes=routed_bytes, site_name=site_name)
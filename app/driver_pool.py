@@ -0,0 +1,234 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from django.conf import settings
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.options import Options
+
+from app.metrics import Gauge, register, stage
+
+
+logger = logging.getLogger(__name__)
+
+
+class DriverPoolExhausted(Exception):
+    pass
+
+
+def build_chrome_options():
+    chrome_options = Options()
+
+    chrome_options.add_argument('--headless')  # run in background
+    chrome_options.add_argument('--ignore-certificate-errors')
+    # for running in docker container
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-gpu')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--start-maximized')
+    chrome_options.page_load_strategy = 'none' # get() returns at once, app.readiness decides when a page is ready
+    chrome_options.set_capability(
+        'goog:loggingPrefs',       # for getting performance and network
+        {'performance': 'ALL'}     # chrome devtools protocol logs
+    )
+    chrome_options.add_experimental_option(
+        'perfLoggingPrefs',        # log network events only, page events
+        {'enableNetwork': True, 'enablePage': False} # are not needed
+    )
+    return chrome_options
+
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses   = 0
+        self.broken = False # set when the session crashed while checked out
+
+
+class DriverPool:
+    """
+    Bounded pool of warm headless Chrome sessions.
+
+    At most `size` sessions exist at once, idle, checked out or starting,
+    warm() included. A checkout waits up to `timeout` seconds for a free
+    session and raises DriverPoolExhausted after that.
+    Sessions are reset on checkin and recycled after `max_uses` checkouts
+    or as soon as they crash.
+    """
+
+    def __init__(self, size, max_uses, timeout, options_factory=build_chrome_options):
+        self.size            = size
+        self.max_uses        = max_uses
+        self.timeout         = timeout
+        self.options_factory = options_factory
+        self._idle           = queue.LifoQueue() # most recently used driver is the warmest
+        self._slots          = threading.BoundedSemaphore(size)
+        self._busy           = 0
+        self._live           = 0 # sessions that exist or are starting
+        self._count_lock     = threading.Lock()
+        self._closed         = False
+
+    @property
+    def busy(self):
+        return self._busy
+
+    @property
+    def idle(self):
+        return self._idle.qsize()
+
+    def _reserve(self):
+        # room for one more session, False when `size` of them exist already
+        with self._count_lock:
+            if self._live >= self.size:
+                return False
+            self._live += 1
+            return True
+
+    def _unreserve(self):
+        with self._count_lock:
+            self._live -= 1
+
+    def _start_driver(self):
+        try:
+            with stage('chrome_start'):
+                return PooledDriver(webdriver.Chrome(options=self.options_factory()))
+        except Exception:
+            self._unreserve()
+            raise
+
+    def _quit_driver(self, pooled):
+        try:
+            pooled.driver.quit()
+        except Exception:
+            logger.warning('Failed to quit chrome driver', exc_info=True)
+        finally:
+            self._unreserve()
+
+    def warm(self, count=None):
+        count = self.size if count is None else min(count, self.size)
+        started = 0
+        while self.idle < count and self._reserve():
+            try:
+                self._idle.put(self._start_driver())
+                started += 1
+            except Exception:
+                logger.exception('Failed to start chrome driver while warming the pool')
+                break
+        return started
+
+    def _take_driver(self, deadline):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        if self._reserve():
+            return self._start_driver()
+        # every session exists already and none is checked out by us, warm() is starting one
+        try:
+            return self._idle.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            raise DriverPoolExhausted(f'No free chrome driver in {self.timeout} seconds')
+
+    def checkout(self):
+        if self._closed:
+            raise DriverPoolExhausted('Driver pool is closed')
+        deadline = time.monotonic() + self.timeout
+        if not self._slots.acquire(timeout=self.timeout):
+            raise DriverPoolExhausted(f'No free chrome driver in {self.timeout} seconds')
+        try:
+            pooled = self._take_driver(deadline)
+        except Exception:
+            self._slots.release()
+            raise
+        pooled.uses += 1
+        with self._count_lock:
+            self._busy += 1
+        return pooled
+
+    def checkin(self, pooled):
+        try:
+            recycle = self._closed or pooled.broken or pooled.uses >= self.max_uses
+            if not recycle:
+                try:
+                    self.reset(pooled.driver)
+                except Exception:
+                    logger.warning('Failed to reset chrome driver, recycling it', exc_info=True)
+                    recycle = True
+            if recycle:
+                self._quit_driver(pooled)
+            else:
+                self._idle.put(pooled)
+        finally:
+            with self._count_lock:
+                self._busy -= 1
+            self._slots.release()
+
+    def reset(self, driver):
+        # drop everything the previous user could leak to the next one
+        for handle in driver.window_handles[1:]:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(driver.window_handles[0])
+
+        parsed_url = urlparse(driver.current_url)
+        if parsed_url.scheme in ('http', 'https'):
+            driver.execute_cdp_cmd('Storage.clearDataForOrigin', {
+                'origin':       f'{parsed_url.scheme}://{parsed_url.netloc}',
+                'storageTypes': 'all',
+            })
+        driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': []})
+        driver.execute_cdp_cmd('Network.disable', {}) # no more log entries until the next render enables it
+        driver.get('about:blank')
+
+    @contextmanager
+    def driver(self):
+        with stage('pool_wait'):
+            pooled = self.checkout()
+        try:
+            yield pooled.driver
+        except TimeoutException:
+            raise
+        except WebDriverException:
+            pooled.broken = True
+            raise
+        finally:
+            self.checkin(pooled)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit_driver(pooled)
+
+
+_pool      = None
+_pool_lock = threading.Lock()
+
+
+register(Gauge('proxy_driver_pool_size', 'Max chrome sessions of the pool', lambda: _pool and _pool.size))
+register(Gauge('proxy_driver_pool_busy', 'Chrome sessions checked out', lambda: _pool and _pool.busy))
+register(Gauge('proxy_driver_pool_idle', 'Warm chrome sessions waiting for a render', lambda: _pool and _pool.idle))
+
+
+def get_driver_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DriverPool(
+                size=settings.PROXY_DRIVER_POOL_SIZE,
+                max_uses=settings.PROXY_DRIVER_POOL_MAX_USES,
+                timeout=settings.PROXY_DRIVER_POOL_TIMEOUT,
+            )
+            atexit.register(_pool.close)
+            if settings.PROXY_DRIVER_POOL_WARM:
+                threading.Thread(target=_pool.warm, daemon=True).start()
+    return _pool
@@ -30,8 +30,16 @@ class SiteForm(BaseForm):
     class Meta:
         model = Site
         fields = [
-            'name', 'url', 'visit_count', 'routed_data_amount',
+            'name', 'url', 'render_mode', 'rewrite_mode', 'ready_strategy', 'ready_selector', 'ready_timeout',
+            'block_images', 'block_media', 'block_fonts', 'block_trackers', 'blocked_urls',
+            'visit_count', 'routed_data_amount',
         ]
+        help_texts = { # Network.setBlockedURLs only sees urls, resource types are guessed from the file extension
+            'block_images': 'Matched by file extension (png, jpg, webp, svg, ...), images served from urls without one still load.',
+            'block_media':  'Matched by file extension (mp4, webm, mp3, m3u8, ...), streams from urls without one still load.',
+            'block_fonts':  'Matched by file extension (woff, woff2, ttf, otf, eot), fonts from urls without one still load.',
+            'blocked_urls': 'More url patterns to block, one per line, * is a wildcard.',
+        }
         
     def __init__(self, *args, request=None,**kwargs):
         self.request = request
@@ -79,6 +87,12 @@ class SiteForm(BaseForm):
                 raise forms.ValidationError("Site url duplicate")
         return url
 
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('ready_strategy') == Site.ReadyStrategy.SELECTOR and not cleaned_data.get('ready_selector'):
+            self.add_error('ready_selector', "A CSS selector is required for this ready strategy.")
+        return cleaned_data
+
 class CustomUserChangeForm(UserChangeForm):
     old_password = forms.CharField(label='Old Password', widget=forms.PasswordInput, required=False)
     new_password1 = forms.CharField(label='New Password', widget=forms.PasswordInput, required=False)
@@ -0,0 +1,77 @@
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from app.render_queue import claim_job, purge_jobs, run_job
+
+
+PURGE_INTERVAL = 60 # seconds
+
+
+class Command(BaseCommand):
+    help = 'Renders the pages web workers queue with PROXY_RENDER_BACKEND=queue, until SIGTERM or SIGINT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.PROXY_RENDER_WORKERS, help='Pages rendered in parallel')
+        parser.add_argument('--poll-interval', type=float, default=settings.PROXY_RENDER_POLL_INTERVAL, help='Seconds between checks for new jobs when idle')
+
+    def handle(self, *args, **options):
+        # one chrome session per worker thread, more processes scale further
+        concurrency = max(options['concurrency'], 1)
+        if concurrency > settings.PROXY_DRIVER_POOL_SIZE:
+            self.stderr.write(
+                f'--concurrency {concurrency} is above PROXY_DRIVER_POOL_SIZE '
+                f'{settings.PROXY_DRIVER_POOL_SIZE}, renders will wait for chrome'
+            )
+        self.stopping = threading.Event()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        worker_name = f'{socket.gethostname()}:{os.getpid()}'
+        threads = [
+            threading.Thread(
+                target=self.work, args=(f'{worker_name}:{index}', options['poll_interval'], ),
+                name=f'render-worker-{index}',
+            )
+            for index in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f'{worker_name}: {concurrency} render workers started')
+
+        last_purge = 0
+        while any(thread.is_alive() for thread in threads):
+            if time.monotonic() - last_purge >= PURGE_INTERVAL and not self.stopping.is_set():
+                purged = purge_jobs()
+                close_old_connections()
+                if purged:
+                    self.stdout.write(f'Purged {purged} old render jobs')
+                last_purge = time.monotonic()
+            for thread in threads:
+                thread.join(timeout=0.5) # short joins, so signals are handled in time
+        # the driver pool quits its chrome sessions at exit
+
+        self.stdout.write(self.style.SUCCESS(f'{worker_name}: render workers stopped'))
+
+    def stop(self, signum, frame):
+        # drain: jobs that are rendering are finished, no new ones are claimed
+        if not self.stopping.is_set():
+            self.stdout.write(f'{signal.Signals(signum).name} received, finishing running renders')
+        self.stopping.set()
+
+    def work(self, worker, poll_interval):
+        while not self.stopping.is_set():
+            job = claim_job(worker)
+            if job is None:
+                self.stopping.wait(poll_interval)
+                continue
+            started = time.monotonic()
+            run_job(job)
+            self.stdout.write(f'{worker}: {job.url} in {(time.monotonic() - started) * 1000:.0f} ms')
+        close_old_connections()
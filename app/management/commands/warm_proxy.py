@@ -0,0 +1,100 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, unquote_plus
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.http import Http404
+from django.test import RequestFactory
+
+from app.cache import get_rendered_page, set_rendered_page
+from app.driver_pool import DriverPoolExhausted
+from app.models import Site
+from app.render_queue import RenderQueueFull, RenderTimeout, render
+from app.views import StaticProxyView
+
+
+STATIC_PROXY_URL_RE = re.compile(r'/static_proxy/[^/"\'\s]+/([^/"\'\s]+)')
+LOCK_KEY            = 'proxy:warm_lock'
+
+
+class WarmStaticProxyView(StaticProxyView):
+    def count_routed_bytes(self, name, routed_bytes):
+        pass # warming is not traffic of the site
+
+
+class Command(BaseCommand):
+    help = 'Renders the entry pages of the most visited sites and fetches their assets into the proxy caches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=settings.PROXY_WARM_TOP_SITES, help='Number of sites to warm, by visit count')
+        parser.add_argument('--workers', type=int, default=settings.PROXY_WARM_WORKERS, help='Sites warmed in parallel')
+        parser.add_argument('--max-assets', type=int, default=settings.PROXY_WARM_MAX_ASSETS, help='Assets fetched per site')
+        parser.add_argument('--force', action='store_true', help='Render pages that are cached already')
+
+    def handle(self, *args, **options):
+        # cron and run.sh may start runs that overlap, only one does the work
+        if not cache.add(LOCK_KEY, True, timeout=settings.PROXY_WARM_LOCK_TIMEOUT):
+            self.stdout.write('Another warm_proxy run is in progress, skipping')
+            return
+
+        try:
+            sites = list(Site.objects.order_by('-visit_count')[:options['top']])
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+                results = executor.map(
+                    lambda site: self.warm_site(site, options['max_assets'], options['force']),
+                    sites,
+                )
+                failures = 0
+                for site, (page_time, assets, failed_assets, error) in zip(sites, results):
+                    if error:
+                        failures += 1
+                        self.stderr.write(f"{site.name}: failed, {error}")
+                    else:
+                        self.stdout.write(
+                            f"{site.name}: page {page_time * 1000:.0f} ms, "
+                            f"{assets} assets, {failed_assets} failed"
+                        )
+
+            self.stdout.write(self.style.SUCCESS(
+                f'Warmed {len(sites) - failures} of {len(sites)} sites in {time.monotonic() - started:.1f} s'
+            ))
+        finally:
+            cache.delete(LOCK_KEY)
+
+    def warm_site(self, site, max_assets, force):
+        # same cache keys as ProxyView gets for the entry url of the site
+        url = unquote_plus(site.url).removesuffix('/')
+        started = time.monotonic()
+        try:
+            html_content = None if force else get_rendered_page(site.pk, url)
+            if html_content is None:
+                html_content, _ = render(url, site.name, site)
+                set_rendered_page(site.pk, url, html_content)
+        except DriverPoolExhausted:
+            return 0, 0, 0, 'no free chrome driver'
+        except (RenderQueueFull, RenderTimeout, ) as e:
+            return 0, 0, 0, str(e)
+        except Exception as e:
+            return 0, 0, 0, repr(e)
+        page_time = time.monotonic() - started
+
+        asset_urls = list(dict.fromkeys(STATIC_PROXY_URL_RE.findall(html_content)))[:max_assets]
+        failed_assets = sum(not self.warm_asset(site.name, asset_url) for asset_url in asset_urls)
+        return page_time, len(asset_urls), failed_assets, None
+
+    def warm_asset(self, name, asset_url):
+        request = RequestFactory().get('/')
+        view = WarmStaticProxyView()
+        view.setup(request)
+        try:
+            response = view.get(request, name, unquote(asset_url)) # as decoded by the url resolver
+            for _ in (response.streaming_content if response.streaming else ()):
+                pass # the caches are filled while the body is read
+            response.close()
+        except (Http404, OSError):
+            return False
+        return response.status_code < 400
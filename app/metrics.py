@@ -0,0 +1,180 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, ) # seconds
+
+_current_timer = ContextVar('stage_timer', default=None)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name   = name
+        self.help   = help
+        self.labels = labels
+        self.values = {} # label values -> count
+        self._lock  = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[label] for label in self.labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self.values)
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{format_labels(self.labels, key)} {value}')
+        return lines
+
+
+class Gauge:
+    # read from `getter` at scrape time, absent while it returns None
+    def __init__(self, name, help, getter):
+        self.name   = name
+        self.help   = help
+        self.getter = getter
+
+    def expose(self):
+        value = self.getter()
+        if value is None:
+            return []
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge', f'{self.name} {value}']
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=STAGE_BUCKETS):
+        self.name    = name
+        self.help    = help
+        self.labels  = labels
+        self.buckets = buckets
+        self.series  = {} # label values -> [bucket counts..., sum, count]
+        self._lock   = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[label] for label in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.setdefault(key, [0] * (len(self.buckets) + 2))
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {key: list(values) for key, values in self.series.items()}
+        for key, values in sorted(series.items()):
+            cumulative = 0
+            for bucket, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{format_labels(self.labels + ("le", ), key + (bucket, ))} {cumulative}')
+            lines.append(f'{self.name}_bucket{format_labels(self.labels + ("le", ), key + ("+Inf", ))} {values[-1]}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, key)} {values[-2]}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, key)} {values[-1]}')
+        return lines
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, values)) + '}'
+
+
+registry = []
+
+def register(metric):
+    registry.append(metric)
+    return metric
+
+def expose():
+    # Prometheus text format, version 0.0.4
+    return '\n'.join(line for metric in registry for line in metric.expose()) + '\n'
+
+
+requests_total = register(Counter(
+    'proxy_requests_total', 'Proxy requests by view and status code', labels=('view', 'status', ),
+))
+stage_seconds = register(Histogram(
+    'proxy_stage_seconds', 'Time spent per stage of proxy requests', labels=('view', 'stage', ),
+))
+cache_requests_total = register(Counter(
+    'proxy_cache_requests_total', 'Proxy cache lookups by cache and result', labels=('cache', 'result', ),
+))
+upstream_bytes_total = register(Counter(
+    'proxy_upstream_bytes_total', 'Bytes received from upstream sites',
+))
+coalesced_requests_total = register(Counter(
+    'proxy_coalesced_requests_total', 'Requests that waited for an identical request in flight', labels=('flight', ),
+))
+page_ready_total = register(Counter(
+    'proxy_page_ready_total', 'Browser renders by ready strategy and whether it was met or timed out', labels=('strategy', 'outcome', ),
+))
+blocked_requests_total = register(Counter(
+    'proxy_blocked_requests_total', 'Subresource requests the browser skipped while rendering pages',
+))
+blocked_bytes_total = register(Counter(
+    'proxy_blocked_bytes_total', 'Estimated bytes of skipped requests, counts only assets the static proxy has cached',
+))
+
+
+class StageTimer:
+    """
+    Durations of the stages of one request, in the order they ran. Stages
+    can nest, e.g. `render` contains `navigate` and `rewrite`.
+    """
+
+    def __init__(self, view):
+        self.view    = view
+        self.started = time.perf_counter()
+        self.stages  = [] # (name, seconds)
+
+    def add(self, name, seconds):
+        self.stages.append((name, seconds))
+        stage_seconds.observe(seconds, view=self.view, stage=name)
+
+    def finish(self, response):
+        total = time.perf_counter() - self.started
+        stage_seconds.observe(total, view=self.view, stage='total')
+        requests_total.inc(view=self.view, status=response.status_code)
+        response['Server-Timing'] = ', '.join(
+            [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.stages]
+            + [f'total;dur={total * 1000:.1f}']
+        )
+        return response
+
+
+def start_timer(view):
+    timer = StageTimer(view)
+    return timer, _current_timer.set(timer)
+
+def stop_timer(token):
+    _current_timer.reset(token)
+
+@contextmanager
+def stage(name):
+    """
+    Times the block as stage `name` of the current request. A no-op
+    outside of a timed request, e.g. in management commands.
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - started)
+
+def observe_stage(view, name, seconds):
+    # for stages that end after the response left the view, like streaming
+    stage_seconds.observe(seconds, view=view, stage=name)
+
+def cache_result(cache, hit):
+    cache_requests_total.inc(cache=cache, result='hit' if hit else 'miss')
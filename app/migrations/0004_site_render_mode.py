@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_alter_site_name_alter_site_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='site',
+            name='render_mode',
+            field=models.CharField(choices=[('http', 'Plain HTTP fetch'), ('browser', 'Headless browser'), ('auto', 'Auto (HTTP, browser for script rendered pages)')], default='browser', max_length=10),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_site_render_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='site',
+            name='ready_selector',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='ready_strategy',
+            field=models.CharField(choices=[('dom', 'DOMContentLoaded'), ('load', 'Load event'), ('network_idle', 'Network idle'), ('selector', 'CSS selector present')], default='load', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='ready_timeout',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_site_ready_strategy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='site',
+            name='block_fonts',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='block_images',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='block_media',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='block_trackers',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='blocked_urls',
+            field=models.TextField(blank=True),
+        ),
+    ]
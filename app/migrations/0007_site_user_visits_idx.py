@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_site_blocked_resources'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='site',
+            index=models.Index(fields=['user', '-visit_count', 'id'], name='site_user_visits_idx'),
+        ),
+    ]
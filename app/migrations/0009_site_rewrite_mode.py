@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 17:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_renderjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='site',
+            name='rewrite_mode',
+            field=models.CharField(choices=[('server', 'Links rewritten on the server'), ('service_worker', 'Requests rewritten by a service worker in the browser')], default='server', max_length=20),
+        ),
+    ]
@@ -1,11 +1,75 @@
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.shortcuts import redirect
 from django.urls import reverse_lazy
 
+from app.asset_pass import asset_pass_user_id, issue_asset_pass
+from app.metrics import start_timer, stop_timer
+
 class CustomLoginRequiredMixin:
     def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self.async_dispatch(request, *args, **kwargs)
         if not request.user.is_authenticated:
-            messages.error(request, 'You are not logged in!')
-            return redirect(reverse_lazy('login'))
+            return self.handle_not_authenticated(request)
         return super().dispatch(request, *args, **kwargs)
-    
\ No newline at end of file
+
+    async def async_dispatch(self, request, *args, **kwargs):
+        # request.user is a lazy object that hits the db on first access
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return self.handle_not_authenticated(request)
+        return await super().dispatch(request, *args, **kwargs)
+
+    def handle_not_authenticated(self, request):
+        messages.error(request, 'You are not logged in!')
+        return redirect(reverse_lazy('login'))
+
+class AssetPassRequiredMixin(CustomLoginRequiredMixin):
+    """
+    Lets requests with a valid asset pass (app.asset_pass) in without
+    loading the session and the user from the database. Others get the
+    login check, and the asset pass when they pass it.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if asset_pass_user_id(request) is not None:
+            return super(CustomLoginRequiredMixin, self).dispatch(request, *args, **kwargs)
+        if self.view_is_async:
+            return self.async_asset_pass_dispatch(request, *args, **kwargs)
+        response = super().dispatch(request, *args, **kwargs)
+        if request.user.is_authenticated:
+            issue_asset_pass(request, response)
+        return response
+
+    async def async_asset_pass_dispatch(self, request, *args, **kwargs):
+        response = await super().dispatch(request, *args, **kwargs)
+        if request.user.is_authenticated: # loaded by the login check already
+            issue_asset_pass(request, response)
+        return response
+
+class StageTimingMixin:
+    """
+    Times the request with a StageTimer, that app.metrics.stage() blocks
+    anywhere below the view add to, and sends the stages back in a
+    Server-Timing header.
+    """
+    metrics_view = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self.async_timed_dispatch(request, *args, **kwargs)
+        timer, token = start_timer(self.metrics_view)
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        finally:
+            stop_timer(token)
+        return timer.finish(response)
+
+    async def async_timed_dispatch(self, request, *args, **kwargs):
+        timer, token = start_timer(self.metrics_view)
+        try:
+            response = await super().dispatch(request, *args, **kwargs)
+        finally:
+            stop_timer(token)
+        return timer.finish(response)
@@ -1,16 +1,100 @@
 import uuid
+from urllib.parse import urlparse
+
 from django.db import models
 from django.contrib.auth.models import User
 
 
 class Site(models.Model):
+    class RenderMode(models.TextChoices):
+        HTTP    = 'http', 'Plain HTTP fetch'
+        BROWSER = 'browser', 'Headless browser'
+        AUTO    = 'auto', 'Auto (HTTP, browser for script rendered pages)'
+
+    class ReadyStrategy(models.TextChoices):
+        DOM          = 'dom', 'DOMContentLoaded'
+        LOAD         = 'load', 'Load event'
+        NETWORK_IDLE = 'network_idle', 'Network idle'
+        SELECTOR     = 'selector', 'CSS selector present'
+
+    class RewriteMode(models.TextChoices):
+        SERVER         = 'server', 'Links rewritten on the server'
+        SERVICE_WORKER = 'service_worker', 'Requests rewritten by a service worker in the browser'
+
     id                 = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user               = models.ForeignKey(User, on_delete=models.CASCADE, editable=False, null=False, blank=False)
     name               = models.CharField(max_length=30, unique=True, db_index=True, null=False, blank=False)
     url                = models.URLField(max_length=200, null=False, blank=False)
     visit_count        = models.IntegerField(default=0)    # Counts of visits a site through proxy 
     routed_data_amount = models.BigIntegerField(default=0) # Amount of data in bytes routed by proxy 
+    render_mode        = models.CharField(max_length=10, choices=RenderMode.choices, default=RenderMode.BROWSER)
+    rewrite_mode       = models.CharField(max_length=20, choices=RewriteMode.choices, default=RewriteMode.SERVER)
+    ready_strategy     = models.CharField(max_length=20, choices=ReadyStrategy.choices, default=ReadyStrategy.LOAD) # when a browser rendered page is taken
+    ready_selector     = models.CharField(max_length=200, blank=True)      # for the CSS selector strategy
+    ready_timeout      = models.FloatField(null=True, blank=True)          # seconds, default depends on the strategy
+    block_images       = models.BooleanField(default=True)  # subresources the browser skips while rendering,
+    block_media        = models.BooleanField(default=True)  # they are loaded through the static proxy later anyway
+    block_fonts        = models.BooleanField(default=True)
+    block_trackers     = models.BooleanField(default=True)  # known analytics and ad domains
+    blocked_urls       = models.TextField(blank=True)       # more url patterns to block, one per line, * is a wildcard
+
+    class Meta:
+        indexes = [ # keyset pagination of the site list, see app.pagination
+            models.Index(fields=['user', '-visit_count', 'id'], name='site_user_visits_idx'),
+        ]
+
+    rendering_fields = ('name', 'url', 'render_mode', 'rewrite_mode', 'ready_strategy', 'ready_selector', ) # fields that rewritten pages of the site depend on
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_rendering_fields()
+        return instance
+
+    def remember_rendering_fields(self):
+        self._loaded_rendering_fields = {
+            field: self.__dict__.get(field) for field in self.rendering_fields
+        }
+
+    @property
+    def host(self): # like ResolvedSite.host, renders get either
+        return urlparse(self.url).netloc
+
+    @property
+    def rendering_fields_changed(self):
+        loaded = getattr(self, '_loaded_rendering_fields', None)
+        if loaded is None:
+            return True
+        return any(loaded[field] != self.__dict__.get(field) for field in self.rendering_fields)
     
     def __str__(self):
         return self.name
-    
\ No newline at end of file
+    
+
+class RenderJob(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        RUNNING = 'running', 'Running'
+        DONE    = 'done', 'Done'
+        FAILED  = 'failed', 'Failed'
+
+    id           = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    site         = models.ForeignKey(Site, on_delete=models.CASCADE)
+    url          = models.TextField()                                      # proxied urls can be longer than URLField allows
+    name         = models.CharField(max_length=100)                        # site name as it appears in proxy urls
+    status       = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    html         = models.TextField(null=True, blank=True)                 # rewritten page, once done
+    routed_bytes = models.BigIntegerField(default=0)
+    error        = models.TextField(blank=True)
+    worker       = models.CharField(max_length=100, blank=True)
+    created_at   = models.DateTimeField(auto_now_add=True)
+    deadline     = models.DateTimeField()                                  # the submitter stops waiting after that
+    finished_at  = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [ # workers claim the oldest pending job
+            models.Index(fields=['status', 'created_at'], name='renderjob_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.url} ({self.status})'
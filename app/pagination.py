@@ -0,0 +1,84 @@
+import uuid
+
+from django.db.models import Q
+
+
+class KeysetPage:
+    """
+    One page of a keyset paginated list. Cursors are the sort key of the
+    first and the last row, the neighbouring pages are the rows right
+    before and right after them.
+    """
+
+    def __init__(self, object_list, key, has_previous, has_next):
+        self.object_list     = object_list
+        self.has_previous    = has_previous
+        self.has_next        = has_next
+        self.previous_cursor = encode_cursor(key(object_list[0])) if object_list and has_previous else None
+        self.next_cursor     = encode_cursor(key(object_list[-1])) if object_list and has_next else None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(key):
+    visit_count, pk = key
+    return f'{visit_count}_{pk.hex}'
+
+def decode_cursor(cursor):
+    try:
+        visit_count, pk = cursor.split('_', 1)
+        return int(visit_count), uuid.UUID(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+class SiteKeysetPaginator:
+    """
+    Keyset pagination of sites ordered by visit count, most visited first,
+    and id to break ties. Every page is a single index range scan of
+    (user, -visit_count, id), however deep it is, and no rows are counted.
+    """
+
+    ordering = ('-visit_count', 'id', )
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    @staticmethod
+    def key(site):
+        return site.visit_count, site.pk
+
+    def after(self, key):
+        visit_count, pk = key
+        return Q(visit_count__lt=visit_count) | Q(visit_count=visit_count, id__gt=pk)
+
+    def before(self, key):
+        visit_count, pk = key
+        return Q(visit_count__gt=visit_count) | Q(visit_count=visit_count, id__lt=pk)
+
+    def page(self, after=None, before=None, last=False):
+        after, before = decode_cursor(after), decode_cursor(before)
+        queryset = self.queryset
+        backwards = bool(before) or (last and not after)
+        if after:
+            queryset = queryset.filter(self.after(after))
+        elif before:
+            queryset = queryset.filter(self.before(before))
+
+        if backwards:
+            queryset = queryset.order_by('visit_count', '-id')
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            return KeysetPage(rows, self.key, has_previous=has_more, has_next=bool(before))
+        return KeysetPage(rows, self.key, has_previous=bool(after), has_next=has_more)
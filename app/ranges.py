@@ -0,0 +1,54 @@
+import re
+
+
+RANGE_RE         = re.compile(r'^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$', re.IGNORECASE)
+CONTENT_RANGE_RE = re.compile(r'^\s*bytes\s+0-(\d+)/(\d+)\s*$', re.IGNORECASE)
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    First and last byte position, both inclusive, of the single byte
+    range `header` asks for in a body of `size` bytes. None when it does
+    not ask for exactly one byte range, the whole body is served then.
+    Raises RangeNotSatisfiable for ranges that start after the end, which
+    is every range of an empty body.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+
+    if not first: # suffix range, the last `last` bytes
+        if int(last) == 0 or size == 0:
+            raise RangeNotSatisfiable
+        return max(size - int(last), 0), size - 1
+
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        raise RangeNotSatisfiable
+    return first, min(int(last), size - 1) if last else size - 1
+
+def if_range_matches(if_range, etags, last_modified):
+    # If-Range holds a strong etag or a date, the range is only served for an unchanged body
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"'):
+        return if_range in etags
+    if if_range.startswith('W/'):
+        return False
+    return bool(last_modified) and if_range == last_modified
+
+def content_range(first, last, size):
+    return f'bytes {first}-{last}/{size}'
+
+def covers_whole_body(content_range_header):
+    # a 206 for "bytes=0-" holds the complete body, it can be cached like a 200
+    match = CONTENT_RANGE_RE.match(content_range_header or '')
+    return bool(match) and int(match.group(1)) + 1 == int(match.group(2))
@@ -0,0 +1,88 @@
+import logging
+import time
+
+from django.conf import settings
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from app.models import Site
+
+
+logger = logging.getLogger(__name__)
+
+POLL_FREQUENCY = 0.1 # seconds
+
+# get() returns at once, the document a session was on (about:blank, data:, for new ones) stays until the
+# new one commits, so it is marked before navigating and never counts as the rendered page
+MARK_DOCUMENT_SCRIPT = 'window.__proxyPreviousDocument = true'
+READY_STATE_SCRIPT   = "return window.__proxyPreviousDocument ? 'loading' : document.readyState"
+
+
+class Readiness:
+    def __init__(self, strategy, waited, timed_out):
+        self.strategy  = strategy
+        self.waited    = waited    # seconds
+        self.timed_out = timed_out # the page was taken as it was when the timeout passed
+
+    def __str__(self):
+        return f'{self.strategy} after {self.waited * 1000:.0f} ms' + (' (timed out)' if self.timed_out else '')
+
+
+def navigate(driver, url):
+    driver.execute_script(MARK_DOCUMENT_SCRIPT)
+    driver.get(url)
+
+def document_ready_state(*states):
+    def condition(driver):
+        return driver.execute_script(READY_STATE_SCRIPT) in states
+    return condition
+
+def network_idle(network, idle_seconds):
+    def condition(driver):
+        return (
+            network.requests > 0
+            and network.idle_for() >= idle_seconds
+            and driver.execute_script(READY_STATE_SCRIPT) != 'loading'
+        )
+    return condition
+
+def ready_condition(strategy, network, selector=''):
+    if strategy == Site.ReadyStrategy.DOM:
+        return document_ready_state('interactive', 'complete')
+    if strategy == Site.ReadyStrategy.NETWORK_IDLE:
+        return network_idle(network, settings.PROXY_NETWORK_IDLE_MS / 1000)
+    if strategy == Site.ReadyStrategy.SELECTOR:
+        element_present = EC.presence_of_element_located((By.CSS_SELECTOR, selector))
+        return lambda driver: driver.execute_script(READY_STATE_SCRIPT) != 'loading' and element_present(driver)
+    return document_ready_state('complete')
+
+def draining(network, condition):
+    # every poll consumes the CDP log, whatever the strategy, so it never piles up in chrome's buffer
+    def poll(driver):
+        network.drain()
+        return condition(driver)
+    return poll
+
+def wait_until_ready(driver, network, strategy=Site.ReadyStrategy.LOAD, selector='', timeout=None):
+    """
+    Waits until the page in `driver` is ready by `strategy`, at most
+    `timeout` seconds (by default the one set for the strategy). A page
+    that is not ready in time is used as it is, so a slow or unusual page
+    costs the timeout but never fails the render.
+    """
+    if timeout is None:
+        timeout = settings.PROXY_READY_TIMEOUTS[strategy]
+    started = time.monotonic()
+    timed_out = False
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=POLL_FREQUENCY) \
+            .until(draining(network, ready_condition(strategy, network, selector)))
+    except TimeoutException:
+        timed_out = True
+        driver.execute_script('window.stop()') # freeze the page, it is snapshotted next
+
+    readiness = Readiness(strategy, time.monotonic() - started, timed_out)
+    logger.info('Page %s ready by %s', driver.current_url, readiness)
+    return readiness
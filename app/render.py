@@ -0,0 +1,134 @@
+import logging
+import re
+
+import requests
+
+from app import upstream
+from app.blocking import blocked_url_patterns, estimate_saved_bytes
+from app.cdp import NetworkCollector
+from app.driver_pool import get_driver_pool
+from app.metrics import blocked_bytes_total, blocked_requests_total, page_ready_total, stage
+from app.models import Site
+from app.readiness import navigate, wait_until_ready
+from app.rewriter import rewrite_html
+from app.service_worker import inject_bootstrap
+from app.utils import CHARSET_RE
+
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_OR_STYLE_RE = re.compile(r'<(script|style|template)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+SCRIPT_TAG_RE      = re.compile(r'<script\b', re.IGNORECASE)
+TAG_RE             = re.compile(r'<[^>]*>')
+EMPTY_MOUNT_RE     = re.compile( # root element of a client side app, filled by scripts
+    r'<(div|main|body)\b[^>]*\b(id=["\']?(root|app|__next|__nuxt|svelte)\b|ng-app|data-reactroot)[^>]*>\s*</\1>',
+    re.IGNORECASE,
+)
+NOSCRIPT_RE        = re.compile(r'<noscript\b[^>]*>[^<]*(enable|requires?)\s+javascript', re.IGNORECASE)
+MIN_TEXT_LENGTH    = 200 # characters of visible text a server rendered page has at least
+
+
+class UpstreamStatusError(requests.HTTPError):
+    # upstream answered the page with an error status, `routed_bytes` is what it cost anyway
+    def __init__(self, status_code, url, routed_bytes, **kwargs):
+        super().__init__(f'{status_code} error for {url}', **kwargs)
+        self.status_code  = status_code
+        self.routed_bytes = routed_bytes
+
+
+def looks_script_rendered(html_content):
+    if EMPTY_MOUNT_RE.search(html_content) or NOSCRIPT_RE.search(html_content):
+        return True
+    if not SCRIPT_TAG_RE.search(html_content):
+        return False
+    text = TAG_RE.sub(' ', SCRIPT_OR_STYLE_RE.sub(' ', html_content))
+    return len(' '.join(text.split())) < MIN_TEXT_LENGTH
+
+def fetch_page(url):
+    """
+    Fetches `url` with a single GET. Returns the html and the amount of
+    bytes received from upstream (as sent, before content decoding).
+    Raises UpstreamStatusError for 4xx and 5xx answers, error pages are
+    neither rewritten nor cached.
+    """
+    with stage('fetch'):
+        response = upstream.fetch(url, stream=True)
+        try:
+            body = response.content
+            routed_bytes = response.raw.tell()
+        finally:
+            response.close()
+    if response.status_code >= 400:
+        raise UpstreamStatusError(response.status_code, url, routed_bytes, response=response)
+
+    charset = CHARSET_RE.search(response.headers.get('content-type', '')) \
+        or CHARSET_RE.search(body[:2048].decode('ascii', errors='ignore'))
+    try:
+        html_content = body.decode(charset.group(1) if charset else 'utf-8', errors='replace')
+    except LookupError:
+        html_content = body.decode('utf-8', errors='replace')
+    return html_content, routed_bytes
+
+def browser_page(url, site):
+    """
+    Renders `url` in a pooled headless Chrome, with the subresources the
+    site blocks left out. Returns the html and the amount of bytes the
+    browser received from upstream.
+    """
+    with get_driver_pool().driver() as driver: # warm session, returned to the pool on exit
+        driver.execute_cdp_cmd('Network.enable', {}) # allow CDP network logs
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked_url_patterns(site)})
+        network = NetworkCollector(driver)
+        with stage('navigate'):
+            navigate(driver, url)
+        with stage('ready'):
+            readiness = wait_until_ready(driver, network, site.ready_strategy, site.ready_selector, site.ready_timeout)
+        page_ready_total.inc(strategy=readiness.strategy, outcome='timeout' if readiness.timed_out else 'ready')
+        with stage('snapshot'):
+            page_source = driver.page_source
+        with stage('cdp_log'):
+            network.drain() # what came in since the last readiness poll
+        if network.document_status and network.document_status >= 400:
+            raise UpstreamStatusError(network.document_status, url, network.routed_bytes)
+
+        if network.blocked:
+            saved_bytes = estimate_saved_bytes(network.blocked)
+            blocked_requests_total.inc(len(network.blocked))
+            blocked_bytes_total.inc(saved_bytes)
+            logger.info(
+                'Blocked %s requests while rendering %s, about %s bytes saved', len(network.blocked), url, saved_bytes,
+            )
+        return page_source, network.routed_bytes
+
+def render_page(url, name, site):
+    """
+    Gets `url` the way the render mode of `site` says and rewrites its
+    links to the proxy. Returns the rewritten html and the amount of routed
+    bytes. Blocks for the whole render, async code runs it in a worker
+    thread. Error pages raise UpstreamStatusError, in either path.
+
+    In auto mode a plain fetch that fails, e.g. a 403 for a client that is
+    not a browser, falls back to the browser.
+    """
+    total_traffic = 0
+    if site.render_mode == Site.RenderMode.HTTP:
+        html_content, total_traffic = fetch_page(url)
+        return rewrite_page(html_content, url, name, site), total_traffic
+    if site.render_mode == Site.RenderMode.AUTO:
+        try:
+            html_content, total_traffic = fetch_page(url)
+        except requests.RequestException as e:
+            total_traffic = getattr(e, 'routed_bytes', 0)
+            logger.info('Plain fetch of %s failed (%s), rendering it in the browser', url, e)
+        else:
+            if not looks_script_rendered(html_content):
+                return rewrite_page(html_content, url, name, site), total_traffic
+
+    html_content, browser_traffic = browser_page(url, site)
+    return rewrite_page(html_content, url, name, site), total_traffic + browser_traffic
+
+def rewrite_page(html_content, url, name, site):
+    with stage('rewrite'):
+        if site.rewrite_mode == Site.RewriteMode.SERVICE_WORKER: # links are left to the browser
+            return inject_bootstrap(html_content, site, url)
+        return rewrite_html(html_content, name, site.url.removesuffix('/'))
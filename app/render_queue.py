@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from app.metrics import Gauge, register, stage
+from app.models import RenderJob
+from app.render import render_page
+
+
+logger = logging.getLogger(__name__)
+
+
+class RenderQueueFull(Exception):
+    pass
+
+class RenderTimeout(Exception):
+    pass
+
+class RenderFailed(Exception):
+    pass
+
+
+def uses_queue():
+    return settings.PROXY_RENDER_BACKEND == 'queue'
+
+def pending_jobs():
+    return RenderJob.objects.filter(status=RenderJob.Status.PENDING, deadline__gt=timezone.now())
+
+register(Gauge(
+    'proxy_render_queue_pending', 'Renders waiting for a render worker',
+    lambda: pending_jobs().count() if uses_queue() else None,
+))
+
+
+def submit(url, name, site):
+    # the depth check and the insert are not atomic, the limit is a soft one
+    if pending_jobs().count() >= settings.PROXY_RENDER_QUEUE_DEPTH:
+        raise RenderQueueFull(f'{settings.PROXY_RENDER_QUEUE_DEPTH} renders are waiting already')
+    return RenderJob.objects.create(
+        site_id=site.pk, url=url, name=name,
+        deadline=timezone.now() + timedelta(seconds=settings.PROXY_RENDER_TIMEOUT),
+    ).pk
+
+def poll(job_id):
+    """
+    Result of the job: the html and the amount of routed bytes once it is
+    done, None while it is not. A finished job is deleted when its result
+    is read.
+    """
+    job = RenderJob.objects.filter(pk=job_id).values('status', 'html', 'routed_bytes', 'error').first()
+    if job is None:
+        raise RenderFailed('Render job is gone') # purged, or its site was deleted
+    if job['status'] == RenderJob.Status.FAILED:
+        RenderJob.objects.filter(pk=job_id).delete()
+        raise RenderFailed(job['error'])
+    if job['status'] != RenderJob.Status.DONE:
+        return None
+    RenderJob.objects.filter(pk=job_id).delete()
+    return job['html'], job['routed_bytes']
+
+def abandon(job_id):
+    # a job a worker started already is finished anyway, its result is purged later
+    RenderJob.objects.filter(pk=job_id, status=RenderJob.Status.PENDING).update(
+        status=RenderJob.Status.FAILED, error='Nobody waits for the result anymore', finished_at=timezone.now(),
+    )
+
+def render(url, name, site):
+    """
+    Same as render_page, but with the queue backend the page is rendered
+    by manage.py run_render_workers while this thread waits for the result
+    for up to PROXY_RENDER_TIMEOUT seconds.
+    """
+    if not uses_queue():
+        return render_page(url, name, site)
+
+    with stage('queue'):
+        job_id = submit(url, name, site)
+        deadline = time.monotonic() + settings.PROXY_RENDER_TIMEOUT
+        while True:
+            result = poll(job_id)
+            if result is not None:
+                return result
+            if time.monotonic() >= deadline:
+                abandon(job_id)
+                raise RenderTimeout(f'{url} was not rendered in {settings.PROXY_RENDER_TIMEOUT} seconds')
+            time.sleep(settings.PROXY_RENDER_POLL_INTERVAL)
+
+async def arender(url, name, site):
+    if not uses_queue(): # chrome blocks for the whole render, keep it off the event loop
+        return await sync_to_async(render_page, thread_sensitive=False)(url, name, site)
+
+    with stage('queue'):
+        job_id = await sync_to_async(submit)(url, name, site)
+        deadline = time.monotonic() + settings.PROXY_RENDER_TIMEOUT
+        while True:
+            result = await sync_to_async(poll)(job_id)
+            if result is not None:
+                return result
+            if time.monotonic() >= deadline:
+                await sync_to_async(abandon)(job_id)
+                raise RenderTimeout(f'{url} was not rendered in {settings.PROXY_RENDER_TIMEOUT} seconds')
+            await asyncio.sleep(settings.PROXY_RENDER_POLL_INTERVAL)
+
+
+def claim_job(worker):
+    """
+    Marks the oldest pending job as running by `worker` and returns it, None
+    when there is nothing to do. The claim is a conditional update, so two
+    workers never get the same job, on any database.
+    """
+    candidates = pending_jobs().order_by('created_at').values_list('pk', flat=True)[:10]
+    for job_id in candidates:
+        claimed = RenderJob.objects.filter(pk=job_id, status=RenderJob.Status.PENDING).update(
+            status=RenderJob.Status.RUNNING, worker=worker,
+        )
+        if claimed:
+            return RenderJob.objects.select_related('site').get(pk=job_id)
+    return None
+
+def run_job(job):
+    try:
+        html_content, routed_bytes = render_page(job.url, job.name, job.site)
+    except Exception as e:
+        logger.warning('Render of %s failed: %r', job.url, e)
+        RenderJob.objects.filter(pk=job.pk).update(
+            status=RenderJob.Status.FAILED, error=repr(e), finished_at=timezone.now(),
+        )
+    else:
+        RenderJob.objects.filter(pk=job.pk).update(
+            status=RenderJob.Status.DONE, html=html_content, routed_bytes=routed_bytes, finished_at=timezone.now(),
+        )
+    finally:
+        close_old_connections()
+
+def purge_jobs():
+    # results nobody picked up and jobs of workers that died
+    expired = timezone.now() - timedelta(seconds=settings.PROXY_RENDER_JOB_RETENTION)
+    deleted, _ = RenderJob.objects.filter(created_at__lt=expired).delete()
+    return deleted
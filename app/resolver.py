@@ -0,0 +1,95 @@
+import threading
+import uuid
+from collections import OrderedDict, namedtuple
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.cache import cache
+
+from app.models import Site
+
+
+GENERATION_KEY = 'proxy:sites_generation'
+SITE_FIELDS    = (
+    'id', 'name', 'url', 'render_mode', 'rewrite_mode', 'ready_strategy', 'ready_selector', 'ready_timeout',
+    'block_images', 'block_media', 'block_fonts', 'block_trackers', 'blocked_urls',
+)
+
+
+class ResolvedSite(namedtuple('ResolvedSite', (*SITE_FIELDS, 'scheme', 'host', ))):
+    """
+    The fields of a Site the proxy needs to serve and render its pages. An
+    immutable tuple, so one instance is shared by all threads of the
+    process, and no model instance is built per lookup.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_values(cls, values):
+        parsed_url = urlparse(values['url'])
+        return cls(**values, scheme=parsed_url.scheme, host=parsed_url.netloc)
+
+    @property
+    def pk(self):
+        return self.id
+
+
+class SiteResolver:
+    """
+    Per process LRU of ResolvedSite records by name, for the proxy views.
+
+    Entries are tagged with a generation token kept in the shared cache.
+    Saving or deleting any Site replaces the token (see app.signals), so
+    every process drops its entries on the next lookup, for the price of
+    one cache read instead of a database query.
+    """
+
+    def __init__(self, size):
+        self.size   = size
+        self._sites = OrderedDict() # name -> (generation, ResolvedSite or None)
+        self._lock  = threading.Lock()
+
+    def generation(self):
+        generation = cache.get(GENERATION_KEY)
+        if generation is None:
+            cache.add(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+            generation = cache.get(GENERATION_KEY)
+        return generation
+
+    def resolve(self, name):
+        generation = self.generation()
+        with self._lock:
+            entry = self._sites.get(name)
+            if entry and entry[0] == generation:
+                self._sites.move_to_end(name)
+                site = entry[1]
+                if site is None:
+                    raise Site.DoesNotExist(f'No site named {name!r}')
+                return site
+
+        values = Site.objects.filter(name=name).values(*SITE_FIELDS).first()
+        site = ResolvedSite.from_values(values) if values else None
+        with self._lock:
+            self._sites[name] = (generation, site)
+            self._sites.move_to_end(name)
+            while len(self._sites) > self.size:
+                self._sites.popitem(last=False)
+        if site is None:
+            raise Site.DoesNotExist(f'No site named {name!r}')
+        return site
+
+    def invalidate(self):
+        with self._lock:
+            self._sites.clear()
+        cache.set(GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+site_resolver = SiteResolver(size=settings.PROXY_SITE_RESOLVER_SIZE)
+
+
+def resolve_site(name):
+    return site_resolver.resolve(name)
+
+def invalidate_resolved_sites():
+    site_resolver.invalidate()
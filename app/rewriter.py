@@ -0,0 +1,242 @@
+import html
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlparse
+
+from bs4 import BeautifulSoup
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from app.url_tokens import flush_url_tokens, get_url_tokens
+from app.utils import urlencode
+
+
+REWRITTEN_TAGS  = ('a', 'script', 'link', 'meta', 'img', )
+REWRITTEN_ATTRS = ('href', 'src', 'content', 'data-src', )
+
+# same tokenization of a start tag as html.parser uses
+TAG_NAME_RE = re.compile(r'<[a-zA-Z][^\t\n\r\f />\x00]*(?:\s|/(?!>))*')
+ATTR_RE     = re.compile(
+    r'((?<=[\'"\s/])[^\s/>][^\s/=>]*)(\s*=+\s*'
+    r'(\'[^\']*\'|"[^"]*"|(?![\'"])[^>\s]*))?(?:\s|/(?!>))*'
+)
+NEWLINE_RE  = re.compile(r'\n')
+CSS_URL_RE  = re.compile(
+    r'url\(\s*(?P<quote>[\'"]?)(?P<url>.*?)(?P=quote)\s*\)'
+    r'|@import\s+(?P<import_quote>[\'"])(?P<import_url>.*?)(?P=import_quote)',
+    re.IGNORECASE,
+)
+CSS_OPEN_RE = re.compile(r'url\(|@import\s+[\'"]', re.IGNORECASE) # start of a reference CSS_URL_RE may match
+
+
+class UrlRewriter:
+    """Maps urls of the proxied site to proxy urls."""
+
+    def __init__(self, name, site_url, tokens=None):
+        parsed_site_url         = urlparse(site_url)
+        self.tokens             = settings.PROXY_URL_TOKENS if tokens is None else tokens
+        self.encode             = get_url_tokens().encode if self.tokens else urlencode
+        self.name               = name
+        self.host               = parsed_site_url.netloc
+        self.host_with_protocol = '{url.scheme}://{url.netloc}'.format(url=parsed_site_url)
+        self.page_prefix        = f'/{name}/'
+        self.static_prefix      = f'/static_proxy/{name}/'
+
+    def rewrite(self, value, static=True):
+        prefix = self.static_prefix if static else self.page_prefix
+        if value.startswith('/'):
+            return prefix + self.encode(self.host_with_protocol + value)
+        elif self.host in value:
+            return prefix + self.encode(value)
+        return value
+
+    def rewrite_srcset(self, value):
+        return ' '.join(self.rewrite(chunk) for chunk in value.split(' '))
+
+    def rewrite_attr(self, tag, attr, value):
+        if attr == 'srcset':
+            return self.rewrite_srcset(value) if value else value
+        return self.rewrite(value or '', static=tag != 'a')
+
+
+def rewrite_bs4(html_content, rewriter):
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    for tag in soup.find_all(REWRITTEN_TAGS):
+        for tag_attr in REWRITTEN_ATTRS:
+            if tag_attr in tag.attrs:
+                tag[tag_attr] = rewriter.rewrite_attr(tag.name, tag_attr, tag.get(tag_attr, ''))
+
+        if tag.get('srcset'):
+            tag['srcset'] = rewriter.rewrite_srcset(tag['srcset'])
+
+    return str(soup)
+
+
+class StreamRewriter(HTMLParser):
+    """
+    One pass over the document with the stdlib tokenizer. Only values of
+    rewritten attributes are replaced, the rest of the document is copied
+    as is.
+    """
+
+    attrs_to_rewrite = (*REWRITTEN_ATTRS, 'srcset', )
+
+    def __init__(self, rewriter):
+        super().__init__(convert_charrefs=True)
+        self.rewriter = rewriter
+        self.edits    = [] # (start, end, replacement) in the source document
+
+    def rewrite(self, html_content):
+        # html.parser reports positions as (line, column) with lines split on \n only
+        self.line_offsets = [0, *(match.end() for match in NEWLINE_RE.finditer(html_content))]
+        self.feed(html_content)
+        self.close()
+
+        chunks = []
+        position = 0
+        for start, end, replacement in self.edits:
+            chunks.append(html_content[position:start])
+            chunks.append(replacement)
+            position = end
+        chunks.append(html_content[position:])
+        return ''.join(chunks)
+
+    def source_offset(self):
+        lineno, offset = self.getpos()
+        return self.line_offsets[lineno - 1] + offset
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in REWRITTEN_TAGS:
+            return
+        if not any(attr in self.attrs_to_rewrite for attr, _ in attrs):
+            return
+
+        tag_start = self.source_offset()
+        tag_text  = self.get_starttag_text()
+        match = ATTR_RE.match(tag_text, TAG_NAME_RE.match(tag_text).end())
+        while match:
+            attr, attr_value = match.group(1).lower(), match.group(3)
+            if attr in self.attrs_to_rewrite and attr_value is not None:
+                raw_value = attr_value
+                if raw_value[:1] == raw_value[-1:] and raw_value[:1] in ('"', "'", ):
+                    raw_value = raw_value[1:-1]
+                value = html.unescape(raw_value)
+                new_value = self.rewriter.rewrite_attr(tag, attr, value)
+                if new_value != value:
+                    value_start, value_end = match.span(3)
+                    self.edits.append((
+                        tag_start + value_start,
+                        tag_start + value_end,
+                        '"' + html.escape(new_value) + '"',
+                    ))
+            match = ATTR_RE.match(tag_text, match.end())
+
+    handle_startendtag = handle_starttag
+
+
+def rewrite_stream(html_content, rewriter):
+    return StreamRewriter(rewriter).rewrite(html_content)
+
+
+class CssRewriter:
+    """
+    Rewrites url() and @import references of a stylesheet in one re.sub
+    pass. References are resolved against the stylesheet url, so relative
+    ones keep pointing to the right upstream file.
+    """
+
+    skipped_schemes = ('data:', 'about:', 'javascript:', '#', )
+
+    def __init__(self, name, stylesheet_url, tokens=None):
+        self.stylesheet_url = stylesheet_url
+        self.static_prefix  = f'/static_proxy/{name}/'
+        self.tokens         = settings.PROXY_URL_TOKENS if tokens is None else tokens
+        self.encode         = get_url_tokens().encode if self.tokens else urlencode
+        self._pending       = '' # tail of the stylesheet that may end inside a reference
+
+    def rewrite_url(self, url):
+        url = url.strip()
+        if not url or url.lower().startswith(self.skipped_schemes):
+            return url
+        absolute_url = urljoin(self.stylesheet_url, url)
+        if not absolute_url.startswith(('http://', 'https://', )):
+            return url
+        return self.static_prefix + self.encode(absolute_url) + '/'
+
+    def replace(self, match):
+        if match.group('url') is not None:
+            quote = match.group('quote')
+            return f"url({quote}{self.rewrite_url(match.group('url'))}{quote})"
+        quote = match.group('import_quote')
+        return f"@import {quote}{self.rewrite_url(match.group('import_url'))}{quote}"
+
+    def rewrite(self, content):
+        rewritten = CSS_URL_RE.sub(self.replace, content)
+        if self.tokens: # before the chunk reaches the browser
+            flush_url_tokens()
+        return rewritten
+
+    @staticmethod
+    def boundary(content):
+        """
+        Position after the last closing brace of `content` that is outside
+        any reference, 0 if there is none. url() can hold braces, e.g. an SVG
+        data: URI with a style sheet. A reference that is not closed yet
+        keeps the rest pending, it may end in the next chunk.
+        """
+        boundary = position = 0
+        for match in CSS_URL_RE.finditer(content):
+            opening = CSS_OPEN_RE.search(content, position, match.start())
+            if not opening and not match.group('quote') and (match.group('url') or '')[:1] in ('"', "'"):
+                opening = match # a quoted url() cut short at a ')' inside it, the closing quote may come next
+            boundary = content.rfind('}', position, (opening or match).start()) + 1 or boundary
+            if opening:
+                return boundary
+            position = match.end()
+        opening = CSS_OPEN_RE.search(content, position)
+        return content.rfind('}', position, opening.start() if opening else len(content)) + 1 or boundary
+
+    def feed(self, chunk):
+        # cut only between rules, so no reference is split across two rewrites
+        self._pending += chunk
+        boundary = self.boundary(self._pending)
+        if not boundary:
+            return ''
+        rewritten = self.rewrite(self._pending[:boundary])
+        self._pending = self._pending[boundary:]
+        return rewritten
+
+    def close(self):
+        pending, self._pending = self._pending, ''
+        return self.rewrite(pending)
+
+    def rewrite_chunks(self, chunks):
+        for chunk in chunks:
+            rewritten = self.feed(chunk)
+            if rewritten:
+                yield rewritten
+        rewritten = self.close()
+        if rewritten:
+            yield rewritten
+
+
+REWRITERS = {
+    'stream': rewrite_stream,
+    'bs4':    rewrite_bs4,
+}
+
+
+def rewrite_html(html_content, name, site_url, backend=None):
+    backend = backend or settings.PROXY_HTML_REWRITER
+    try:
+        rewrite = REWRITERS[backend]
+    except KeyError:
+        raise ImproperlyConfigured(
+            f"Unknown html rewriter '{backend}', choose one of: {', '.join(REWRITERS)}"
+        )
+    rewriter = UrlRewriter(name, site_url)
+    rewritten = rewrite(html_content, rewriter)
+    if rewriter.tokens:
+        flush_url_tokens()
+    return rewritten
@@ -0,0 +1,37 @@
+import re
+from urllib.parse import quote
+
+from django.template.loader import render_to_string
+
+
+# where the bootstrap goes, the first one found
+INSERTION_POINTS = (
+    re.compile(r'<head\b[^>]*>', re.IGNORECASE),
+    re.compile(r'<html\b[^>]*>', re.IGNORECASE),
+    re.compile(r'<!doctype\b[^>]*>', re.IGNORECASE),
+)
+
+
+def proxy_name(site):
+    # the site name as it appears in proxy urls, like in the site list
+    return quote(site.name, safe='')
+
+def service_worker_script(site):
+    return render_to_string('proxy/service_worker.js', {'site': site, 'proxy_name': proxy_name(site)})
+
+def inject_bootstrap(html_content, site, page_url):
+    """
+    Page for the service worker rewrite mode: the upstream html as is, with
+    a <base> of the upstream page and the script that installs the service
+    worker put at the start of <head>. No parsing, one regex search.
+    """
+    bootstrap = render_to_string('proxy/bootstrap.html', {
+        'site':       site,
+        'proxy_name': proxy_name(site),
+        'page_url':   page_url,
+    })
+    for insertion_point in INSERTION_POINTS:
+        match = insertion_point.search(html_content, 0, 4096)
+        if match:
+            return html_content[:match.end()] + bootstrap + html_content[match.end():]
+    return bootstrap + html_content
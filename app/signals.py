@@ -0,0 +1,21 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from app.cache import invalidate_site
+from app.models import Site
+from app.resolver import invalidate_resolved_sites
+
+
+@receiver(post_save, sender=Site)
+def invalidate_site_on_save(sender, instance, created, **kwargs):
+    if not created and instance.rendering_fields_changed:
+        invalidate_site(instance.pk)
+    instance.remember_rendering_fields()
+    # after commit, so no process can load the old row again under the new generation
+    transaction.on_commit(invalidate_resolved_sites)
+
+@receiver(post_delete, sender=Site)
+def invalidate_site_on_delete(sender, instance, **kwargs):
+    invalidate_site(instance.pk)
+    transaction.on_commit(invalidate_resolved_sites)
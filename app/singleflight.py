@@ -0,0 +1,94 @@
+import asyncio
+import threading
+
+from app.metrics import coalesced_requests_total
+
+
+class FlightTimeout(Exception):
+    pass
+
+
+class Flight:
+    def __init__(self):
+        self.done   = threading.Event()
+        self.result = None
+        self.error  = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key within the process. The
+    first caller runs the function, the callers that come while it runs
+    wait up to `timeout` seconds and get its result, or its exception.
+    A key is forgotten as soon as its call returns, this is not a cache.
+    """
+
+    def __init__(self, name):
+        self.name           = name
+        self._flights       = {} # key -> Flight
+        self._async_flights = {} # (event loop, key) -> asyncio.Future
+        self._lock          = threading.Lock()
+
+    def do(self, key, function, timeout):
+        """
+        Result of `function()` and whether it was shared, i.e. computed
+        for another caller.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+
+        if not leader:
+            coalesced_requests_total.inc(flight=self.name)
+            if not flight.done.wait(timeout):
+                raise FlightTimeout(f'{key} is still in flight after {timeout} seconds')
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = function()
+            return flight.result, False
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def ado(self, key, function, timeout):
+        # futures belong to one event loop, flights are shared by the callers on the same loop
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flight = self._async_flights.get((loop, key))
+            leader = flight is None
+            if leader:
+                flight = self._async_flights[(loop, key)] = loop.create_future()
+                flight.add_done_callback(lambda future: future.exception()) # no warning when nobody waited
+
+        if not leader:
+            coalesced_requests_total.inc(flight=self.name)
+            try:
+                return await asyncio.wait_for(asyncio.shield(flight), timeout), True
+            except asyncio.TimeoutError:
+                raise FlightTimeout(f'{key} is still in flight after {timeout} seconds')
+
+        try:
+            result = await function()
+            flight.set_result(result)
+            return result, False
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._async_flights[(loop, key)]
+            if not flight.done(): # the leader was cancelled, e.g. its client went away
+                flight.set_exception(FlightTimeout(f'{key} was abandoned'))
+
+
+page_flights  = SingleFlight('page')
+asset_flights = SingleFlight('asset')
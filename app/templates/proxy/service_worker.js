@@ -0,0 +1,27 @@
+// Service worker of proxied site "{{ site.name|escapejs }}", see app/service_worker.py.
+// Requests of its pages for the site are sent through /static_proxy/, the
+// server only adds a <base> and the bootstrap script to the pages.
+const PROXY_NAME = '{{ proxy_name|escapejs }}';
+const SITE_HOST  = '{{ site.host|escapejs }}';
+
+// same encoding as app.utils.urlencode, decoded by the proxy views
+function proxyPath(url) {
+    return '/static_proxy/' + PROXY_NAME + '/' + encodeURIComponent(url).replace(/%/g, '%25') + '/';
+}
+
+self.addEventListener('install', () => self.skipWaiting());
+self.addEventListener('activate', event => event.waitUntil(self.clients.claim()));
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    // pages of the site are proxy urls already, only GET is proxied
+    if (request.mode === 'navigate' || request.method !== 'GET' || url.host !== SITE_HOST) {
+        return;
+    }
+    event.respondWith(fetch(proxyPath(url.href), {
+        headers:     request.headers, // Range for media among others
+        credentials: 'same-origin',
+        signal:      request.signal,
+    }));
+});
@@ -0,0 +1,575 @@
+import gzip
+import io
+import json
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from unittest import mock
+from urllib.parse import quote_plus
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import path, reverse
+from selenium.common.exceptions import WebDriverException
+
+from app import render_queue, urls, views
+from app.asset_cache import AssetCache
+from app.asset_pass import SALT as ASSET_PASS_SALT
+from app.cache import get_rendered_page, set_rendered_page
+from app.cdp import NetworkCollector
+from app.compression import negotiate, supported_encodings, text_response
+from app.counters import TrafficCounter
+from app.driver_pool import DriverPool, DriverPoolExhausted
+from app.metrics import blocked_bytes_total, blocked_requests_total, coalesced_requests_total
+from app.models import Site
+from app.pagination import SiteKeysetPaginator
+from app.ranges import RangeNotSatisfiable, parse_range
+from app.readiness import Readiness
+from app.render import UpstreamStatusError, browser_page, render_page
+from app.resolver import invalidate_resolved_sites, resolve_site
+from app.rewriter import REWRITERS, CssRewriter, rewrite_html
+from app.service_worker import inject_bootstrap
+from app.singleflight import SingleFlight
+from app.url_tokens import UrlTokens
+from benchmarks.rewrite import FIXTURES_DIR, GOLDEN_DIR, SITE_NAME, SITE_URL, normalized
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# app.urls with the views asgi.py selects, see PROXY_ASYNC_VIEWS
+ASYNC_VIEWS = {'proxy': views.AsyncProxyView, 'static_proxy': views.AsyncStaticProxyView}
+
+class AsyncUrls:
+    urlpatterns = [
+        path(str(pattern.pattern), ASYNC_VIEWS[pattern.name].as_view(), name=pattern.name)
+        if pattern.name in ASYNC_VIEWS else pattern
+        for pattern in urls.urlpatterns
+    ]
+
+
+@override_settings(PROXY_URL_TOKENS=False)
+class RewriterTests(SimpleTestCase):
+    def test_backends_match_baseline_output(self):
+        # golden files hold what ProxyView gave before app.rewriter, see benchmarks.rewrite
+        for page in sorted(FIXTURES_DIR.glob('*.html')):
+            golden = (GOLDEN_DIR / page.name).read_text()
+            for backend in REWRITERS:
+                with self.subTest(page=page.stem, backend=backend):
+                    output = rewrite_html(page.read_text(), SITE_NAME, SITE_URL, backend=backend)
+                    if backend == 'stream': # keeps the source document, only attribute values change
+                        output = normalized(output)
+                    self.assertEqual(output, golden)
+
+
+class CssRewriterTests(SimpleTestCase):
+    stylesheet = (
+        '@import "print.css";\n'
+        '.icon{background:url("data:image/svg+xml,<svg><style>path{fill:url(%23g)}</style></svg>")}\n'
+        '@media (min-width: 600px) {\n'
+        '  .hero { background: url(../img/hero.png) }\n'
+        '  .logo { background: url( \'logo.svg\' ) }\n'
+        '}\n'
+        '.tail{background:url(tail.png)}'
+    )
+
+    def rewriter(self):
+        return CssRewriter('example', 'https://example.com/css/site.css', tokens=False)
+
+    def test_chunk_boundaries_do_not_change_the_output(self):
+        expected = self.rewriter().rewrite(self.stylesheet)
+        self.assertIn('url("data:image/svg+xml,<svg><style>path{fill:url(%23g)}</style></svg>")', expected)
+        self.assertIn('url(/static_proxy/example/https%253A%252F%252Fexample.com%252Fimg%252Fhero.png/)', expected)
+
+        for split in ( # inside the data: URI, right after its inner brace, inside the @media block
+            self.stylesheet.index('fill:url'), self.stylesheet.index('}</style>') + 1,
+            self.stylesheet.index('hero.png'), self.stylesheet.index('.logo'),
+        ):
+            with self.subTest(split=split):
+                chunks = [self.stylesheet[:split], self.stylesheet[split:]]
+                self.assertEqual(''.join(self.rewriter().rewrite_chunks(chunks)), expected)
+        for size in (1, 7, 32):
+            with self.subTest(size=size):
+                chunks = [self.stylesheet[i:i + size] for i in range(0, len(self.stylesheet), size)]
+                self.assertEqual(''.join(self.rewriter().rewrite_chunks(chunks)), expected)
+
+
+class RangeTests(SimpleTestCase):
+    def test_ranges_of_an_empty_body_are_not_satisfiable(self):
+        for header in ('bytes=0-', 'bytes=0-0', 'bytes=-5', ):
+            with self.subTest(header=header), self.assertRaises(RangeNotSatisfiable):
+                parse_range(header, 0)
+
+    def test_suffix_range_longer_than_the_body(self):
+        self.assertEqual(parse_range('bytes=-5', 3), (0, 2))
+
+
+def upstream_response(status_code, body):
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO(body)
+    response.headers['Content-Type'] = 'text/html; charset=utf-8'
+    return response
+
+def log_entry(method, **params):
+    return {'timestamp': 2 ** 50, 'message': json.dumps({'message': {'method': method, 'params': params}})}
+
+
+@override_settings(PROXY_URL_TOKENS=False)
+class RenderModeTests(SimpleTestCase):
+    browser_html = '<html><body><a href="/next/">Next</a></body></html>'
+
+    def render(self, render_mode, status_code):
+        site = Site(name='example', url='https://example.com', render_mode=render_mode)
+        with mock.patch('app.render.upstream.fetch', return_value=upstream_response(status_code, b'Forbidden')), \
+             mock.patch('app.render.browser_page', return_value=(self.browser_html, 1000)) as browser_page:
+            return render_page('https://example.com/page', 'example', site), browser_page
+
+    def test_auto_mode_falls_back_to_the_browser_on_an_error_status(self):
+        (html_content, routed_bytes), browser_page = self.render(Site.RenderMode.AUTO, 403)
+
+        browser_page.assert_called_once()
+        self.assertIn('href="/example/https%253A%252F%252Fexample.com%252Fnext%252F"', html_content)
+        self.assertEqual(routed_bytes, len(b'Forbidden') + 1000) # the failed fetch counts too
+
+    def test_http_mode_raises_on_an_error_status(self):
+        with self.assertRaises(UpstreamStatusError) as raised:
+            self.render(Site.RenderMode.HTTP, 404)
+        self.assertEqual(raised.exception.status_code, 404)
+
+    def test_collector_keeps_the_status_of_the_page(self):
+        driver = mock.Mock()
+        driver.get_log.return_value = [
+            log_entry('Network.requestWillBeSent', requestId='1', request={'url': 'https://example.com/'}),
+            log_entry('Network.responseReceived', requestId='1', type='Document', response={'status': 404}),
+            log_entry('Network.responseReceived', requestId='2', type='Document', response={'status': 200}), # an iframe
+            log_entry('Network.loadingFinished', requestId='1', encodedDataLength=512),
+        ]
+        network = NetworkCollector(driver)
+        network.drain()
+
+        self.assertEqual((network.document_status, network.routed_bytes, network.requests), (404, 512, 1))
+
+
+class BlockingTests(SimpleTestCase):
+    def render(self, log):
+        driver = mock.Mock(page_source='<html></html>')
+        driver.get_log.return_value = log
+        pool = mock.Mock(driver=contextmanager(lambda: (yield driver)))
+        readiness = Readiness('load', waited=0.1, timed_out=False)
+        with mock.patch('app.render.get_driver_pool', return_value=pool), \
+             mock.patch('app.render.navigate'), \
+             mock.patch('app.render.wait_until_ready', return_value=readiness), \
+             mock.patch('app.render.estimate_saved_bytes', return_value=2048) as estimate_saved_bytes:
+            browser_page('https://example.com/', Site(name='example', url='https://example.com'))
+        return driver, estimate_saved_bytes
+
+    def test_blocked_requests_are_counted(self):
+        requests_before, bytes_before = blocked_requests_total.values.get((), 0), blocked_bytes_total.values.get((), 0)
+        driver, estimate_saved_bytes = self.render([
+            log_entry('Network.requestWillBeSent', requestId='1', request={'url': 'https://example.com/a.png'}),
+            log_entry('Network.requestWillBeSent', requestId='2', request={'url': 'https://example.com/b.woff2'}),
+            log_entry('Network.loadingFailed', requestId='1', blockedReason='inspector'),
+            log_entry('Network.loadingFailed', requestId='2', blockedReason='inspector'),
+        ])
+
+        patterns = driver.execute_cdp_cmd.call_args_list[1].args[1]['urls']
+        self.assertIn('*.png?*', patterns)
+        estimate_saved_bytes.assert_called_once_with(['https://example.com/a.png', 'https://example.com/b.woff2'])
+        self.assertEqual(blocked_requests_total.values[()] - requests_before, 2)
+        self.assertEqual(blocked_bytes_total.values[()] - bytes_before, 2048)
+
+
+class SiteResolverTests(TestCase):
+    def setUp(self):
+        invalidate_resolved_sites() # the resolver and the cache outlive test transactions
+        self.user = User.objects.create_user('owner', password='password')
+        self.site = Site.objects.create(user=self.user, name='example', url='https://example.com')
+        self.client.force_login(self.user)
+
+    def edit_site(self, **fields):
+        data = {
+            'name': self.site.name, 'url': self.site.url, 'render_mode': self.site.render_mode,
+            'rewrite_mode': self.site.rewrite_mode, 'ready_strategy': self.site.ready_strategy,
+            **fields,
+        }
+        with self.captureOnCommitCallbacks(execute=True): # the resolver is invalidated on commit
+            response = self.client.post(reverse('site_edit', args=(self.site.pk, )), data)
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+    def test_edit_is_resolved_at_once(self):
+        site = resolve_site('example')
+        self.assertEqual((site.pk, site.scheme, site.host), (self.site.pk, 'https', 'example.com'))
+
+        self.edit_site(url='http://example.org', render_mode=Site.RenderMode.HTTP)
+
+        site = resolve_site('example')
+        self.assertEqual(site.url, 'http://example.org')
+        self.assertEqual((site.scheme, site.host), ('http', 'example.org'))
+        self.assertEqual(site.render_mode, Site.RenderMode.HTTP)
+
+    def test_renamed_site_is_not_resolved_by_its_old_name(self):
+        resolve_site('example')
+
+        self.edit_site(name='renamed')
+
+        self.assertEqual(resolve_site('renamed').pk, self.site.pk)
+        with self.assertRaises(Site.DoesNotExist):
+            resolve_site('example')
+
+
+class TrafficCounterTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('owner', password='password')
+        self.site = Site.objects.create(user=user, name='example', url='https://example.com')
+        self.counter = TrafficCounter(flush_interval=60)
+        self.addCleanup(self.counter._stopped.set) # ends the flusher thread
+
+    def test_failed_flush_is_retried(self):
+        self.counter.add(self.site.pk, visits=1, routed_bytes=100)
+        with mock.patch('app.counters.Site.objects.filter', side_effect=DatabaseError('database is locked')), \
+             self.assertLogs('app.counters', 'ERROR'):
+            self.counter.flush()
+        self.counter.add(self.site.pk, visits=1, routed_bytes=50)
+
+        self.counter.flush()
+
+        self.site.refresh_from_db()
+        self.assertEqual((self.site.visit_count, self.site.routed_data_amount), (2, 150))
+        self.assertEqual(self.counter._pending, {})
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flights = SingleFlight('test')
+        calls, started, release = [], threading.Event(), threading.Event()
+        def function():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'page'
+
+        results = []
+        def caller():
+            results.append(flights.do('key', function, timeout=5))
+        threads = [threading.Thread(target=caller) for _ in range(4)]
+        threads[0].start()
+        started.wait(5)
+        waiting_before = coalesced_requests_total.values.get(('test', ), 0)
+        for thread in threads[1:]:
+            thread.start()
+        deadline = time.monotonic() + 5 # the followers count themselves before they wait
+        while coalesced_requests_total.values.get(('test', ), 0) - waiting_before < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('page', False)] + [('page', True)] * 3)
+
+    def test_error_is_raised_and_key_is_forgotten(self):
+        flights = SingleFlight('test')
+        with self.assertRaises(ValueError):
+            flights.do('key', mock.Mock(side_effect=ValueError), timeout=5)
+        self.assertEqual(flights.do('key', lambda: 'page', timeout=5), ('page', False))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class UrlTokenTests(SimpleTestCase):
+    url = 'https://example.com/img/logo.png?v=2'
+
+    def setUp(self):
+        cache.clear() # the shared cache, tokens of other tests included
+
+    def test_round_trip(self):
+        tokens = UrlTokens(size=10, timeout=60)
+        token = tokens.encode(self.url)
+        self.assertEqual(tokens.decode(token), self.url)
+        self.assertEqual(tokens.encode(self.url), token)
+
+    def test_other_processes_resolve_flushed_tokens(self):
+        tokens = UrlTokens(size=10, timeout=60)
+        token = tokens.encode(self.url)
+        other_process = UrlTokens(size=10, timeout=60)
+        self.assertIsNone(other_process.decode(token))
+
+        tokens.flush()
+
+        self.assertEqual(other_process.decode(token), self.url)
+
+    def test_forged_token_is_not_resolved(self):
+        tokens = UrlTokens(size=10, timeout=60)
+        token = tokens.encode(self.url)
+        tokens.flush()
+        forged = token[:-1] + ('A' if token[-1] != 'A' else 'B')
+        self.assertIsNone(UrlTokens(size=10, timeout=60).decode(forged))
+
+
+class FakeChrome(mock.Mock):
+    def __init__(self, **kwargs):
+        super().__init__(window_handles=['main'], current_url='about:blank')
+
+
+@mock.patch('app.driver_pool.webdriver.Chrome', FakeChrome)
+class DriverPoolTests(SimpleTestCase):
+    def pool(self, size=1, max_uses=10):
+        return DriverPool(size=size, max_uses=max_uses, timeout=0.05, options_factory=mock.Mock)
+
+    def test_sessions_are_bounded_and_reused(self):
+        pool = self.pool()
+        with pool.driver() as driver:
+            self.assertEqual((pool.busy, pool.idle), (1, 0))
+            with self.assertRaises(DriverPoolExhausted):
+                pool.checkout()
+        with pool.driver() as reused:
+            self.assertIs(reused, driver)
+        driver.quit.assert_not_called()
+        self.assertEqual((pool.busy, pool.idle), (0, 1))
+
+    def test_crashed_and_worn_sessions_are_recycled(self):
+        pool = self.pool(max_uses=2)
+        with self.assertRaises(WebDriverException), pool.driver() as crashed:
+            raise WebDriverException('chrome not reachable')
+        crashed.quit.assert_called_once()
+
+        with pool.driver() as driver:
+            self.assertIsNot(driver, crashed)
+        with pool.driver():
+            pass
+        driver.quit.assert_called_once() # after its second use
+        self.assertEqual(pool.idle, 0)
+
+    def test_warm_starts_at_most_size_sessions(self):
+        pool = self.pool(size=2)
+        self.assertEqual(pool.warm(5), 2)
+        self.assertEqual(pool.warm(), 0)
+        self.assertEqual(pool.idle, 2)
+
+
+@override_settings(PROXY_RENDER_BACKEND='queue', PROXY_RENDER_QUEUE_DEPTH=2)
+@mock.patch('app.render_queue.close_old_connections') # would close the connection of the test transaction
+class RenderQueueTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('owner', password='password')
+        self.site = Site.objects.create(user=user, name='example', url='https://example.com')
+
+    def run_next_job(self, **render_page):
+        job = render_queue.claim_job('worker-1')
+        self.assertIsNone(render_queue.claim_job('worker-2')) # claimed once
+        with mock.patch('app.render_queue.render_page', **render_page):
+            render_queue.run_job(job)
+
+    def test_result_is_handed_over_once(self, close_old_connections):
+        job_id = render_queue.submit('https://example.com/page', 'example', self.site)
+        self.assertIsNone(render_queue.poll(job_id))
+
+        self.run_next_job(return_value=('<html></html>', 1000))
+
+        self.assertEqual(render_queue.poll(job_id), ('<html></html>', 1000))
+        with self.assertRaises(render_queue.RenderFailed):
+            render_queue.poll(job_id)
+
+    def test_failed_render_is_raised(self, close_old_connections):
+        job_id = render_queue.submit('https://example.com/page', 'example', self.site)
+        with self.assertLogs('app.render_queue', 'WARNING'):
+            self.run_next_job(side_effect=UpstreamStatusError(404, 'https://example.com/page', 0))
+        with self.assertRaisesMessage(render_queue.RenderFailed, 'UpstreamStatusError'):
+            render_queue.poll(job_id)
+
+    def test_full_queue_is_refused(self, close_old_connections):
+        for _ in range(2):
+            render_queue.submit('https://example.com/page', 'example', self.site)
+        with self.assertRaises(render_queue.RenderQueueFull):
+            render_queue.submit('https://example.com/page', 'example', self.site)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PROXY_URL_TOKENS=False)
+@mock.patch('app.views.count_traffic')
+class ProxyViewTests(TestCase):
+    html = '<html><body><a href="/next/">Next</a></body></html>'
+
+    def setUp(self):
+        invalidate_resolved_sites()
+        self.user = User.objects.create_user('owner', password='password')
+        self.site = Site.objects.create(user=self.user, name='example', url='https://example.com')
+
+    def proxy_url(self, url='https://example.com/page'):
+        return reverse('proxy', args=('example', quote_plus(url)))
+
+    def test_page_is_rendered_once_and_cached(self, count_traffic):
+        self.client.force_login(self.user)
+        with mock.patch('app.views.render', return_value=(self.html, 1000)) as render:
+            responses = [self.client.get(self.proxy_url()) for _ in range(2)]
+
+        render.assert_called_once()
+        for response in responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, self.html.encode())
+        self.assertIn(settings.PROXY_ASSET_PASS_COOKIE, responses[0].cookies)
+        self.assertNotIn(settings.PROXY_ASSET_PASS_COOKIE, responses[1].cookies) # still fresh
+
+    def test_site_edit_invalidates_cached_pages(self, count_traffic):
+        set_rendered_page(self.site.pk, 'https://example.com/page', self.html)
+
+        self.site.visit_count = 5 # not a rendering field
+        self.site.save()
+        self.assertEqual(get_rendered_page(self.site.pk, 'https://example.com/page'), self.html)
+
+        self.site.render_mode = Site.RenderMode.HTTP
+        self.site.save()
+        self.assertIsNone(get_rendered_page(self.site.pk, 'https://example.com/page'))
+
+    def test_anonymous_request_is_sent_to_login(self, count_traffic):
+        response = self.client.get(self.proxy_url())
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+
+    @override_settings(ROOT_URLCONF=AsyncUrls)
+    async def test_async_view_renders_the_page(self, count_traffic):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        with mock.patch('app.views.arender', return_value=(self.html, 1000)) as arender:
+            response = await self.async_client.get(self.proxy_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, self.html.encode())
+        arender.assert_awaited_once()
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PROXY_URL_TOKENS=False)
+class StaticProxyViewTests(TestCase):
+    url = 'https://example.com/css/site.css'
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='password')
+
+    def static_proxy_url(self):
+        return reverse('static_proxy', args=('example', quote_plus(self.url)))
+
+    def get(self, asset_pass=None):
+        if asset_pass:
+            self.client.cookies[settings.PROXY_ASSET_PASS_COOKIE] = asset_pass
+        with mock.patch('app.views.get_rewritten_css', return_value='body{color:red}'):
+            return self.client.get(self.static_proxy_url())
+
+    def test_anonymous_request_without_asset_pass_is_sent_to_login(self):
+        response = self.get()
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+
+    def test_forged_asset_pass_is_sent_to_login(self):
+        response = self.get(asset_pass=f'{self.user.pk}:forged:signature')
+        self.assertEqual(response.status_code, 302)
+
+    def test_asset_pass_skips_the_session(self):
+        asset_pass = signing.TimestampSigner(salt=ASSET_PASS_SALT).sign(str(self.user.pk))
+        response = self.get(asset_pass)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'body{color:red}')
+
+    def test_logged_in_user_gets_an_asset_pass(self):
+        self.client.force_login(self.user)
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(settings.PROXY_ASSET_PASS_COOKIE, response.cookies)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, PROXY_COMPRESS_MIN_BYTES=100)
+class CompressionTests(SimpleTestCase):
+    def test_negotiation(self):
+        self.assertEqual(negotiate('gzip, deflate, br'), supported_encodings()[0]) # br when brotli is installed
+        self.assertEqual(negotiate('gzip;q=0.5, br;q=0'), 'gzip')
+        self.assertIsNone(negotiate('identity'))
+        self.assertIsNone(negotiate('gzip;q=0'))
+
+    def test_text_response_is_compressed_when_large_enough(self):
+        request = RequestFactory().get('/', headers={'Accept-Encoding': 'gzip'})
+        content = '<p>proxied</p>' * 20
+
+        response = text_response(request, content, 60)
+        small_response = text_response(request, '<p>proxied</p>', 60)
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content).decode(), content)
+        self.assertFalse(small_response.has_header('Content-Encoding'))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+
+class AssetCacheTests(SimpleTestCase):
+    headers = {'Content-Type': 'image/png', 'Cache-Control': 'max-age=60'}
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.asset_cache = AssetCache(root.name, max_bytes=1024, max_object_bytes=512)
+
+    def store(self, url, body, chunk_size=4):
+        chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+        return b''.join(self.asset_cache.store_stream(url, 200, self.headers, chunks))
+
+    def test_stored_body_is_looked_up_by_url(self):
+        self.assertEqual(self.store('https://example.com/a.png', b'png body'), b'png body')
+
+        cached_asset = self.asset_cache.lookup('https://example.com/a.png')
+        self.assertTrue(cached_asset.is_fresh())
+        with cached_asset.open() as asset_file:
+            self.assertEqual(asset_file.read(), b'png body')
+        self.assertIsNone(self.asset_cache.lookup('https://example.com/b.png'))
+
+    def test_equal_bodies_are_stored_once(self):
+        self.store('https://example.com/a.png', b'png body')
+        self.store('https://cdn.example.com/a.png', b'png body')
+
+        first = self.asset_cache.lookup('https://example.com/a.png')
+        second = self.asset_cache.lookup('https://cdn.example.com/a.png')
+        self.assertEqual(first.path, second.path)
+        self.assertEqual(len(list((self.asset_cache.root / 'objects').glob('*/*'))), 1)
+
+    def test_unfinished_and_oversized_bodies_are_not_stored(self):
+        stream = self.asset_cache.store_stream('https://example.com/a.png', 200, self.headers, [b'png ', b'body'])
+        next(stream)
+        stream.close() # the client went away
+        self.store('https://example.com/big.png', b'x' * 600, chunk_size=100)
+
+        self.assertIsNone(self.asset_cache.lookup('https://example.com/a.png'))
+        self.assertIsNone(self.asset_cache.lookup('https://example.com/big.png'))
+        self.assertEqual(list((self.asset_cache.root / 'tmp').iterdir()), [])
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('owner', password='password')
+        for index, visit_count in enumerate((5, 3, 3, 1, 0)):
+            Site.objects.create(user=user, name=f'site{index}', url='https://example.com', visit_count=visit_count)
+        self.paginator = SiteKeysetPaginator(Site.objects.filter(user=user), per_page=2)
+
+    def names(self, page):
+        return [site.name for site in page]
+
+    def test_pages_forwards_and_backwards(self):
+        expected = list(Site.objects.order_by('-visit_count', 'id').values_list('name', flat=True)) # a tie at 3
+
+        first = self.paginator.page()
+        second = self.paginator.page(after=first.next_cursor)
+        third = self.paginator.page(after=second.next_cursor)
+
+        self.assertEqual([self.names(first), self.names(second), self.names(third)], [expected[:2], expected[2:4], expected[4:]])
+        self.assertEqual((first.has_previous, third.has_next), (False, False))
+        self.assertEqual(self.names(self.paginator.page(before=third.previous_cursor)), expected[2:4])
+        self.assertEqual(self.names(self.paginator.page(last=True)), expected[3:])
+
+    def test_malformed_cursor_is_the_first_page(self):
+        self.assertEqual(self.names(self.paginator.page(after='not-a-cursor')), self.names(self.paginator.page()))
+
+
+class ServiceWorkerTests(SimpleTestCase):
+    def test_bootstrap_goes_to_the_start_of_head(self):
+        site = Site(name='example', url='https://example.com')
+        page = '<!doctype html><html><head><title>Page</title></head></html>'
+        html_content = inject_bootstrap(page, site, 'https://example.com/page')
+
+        self.assertTrue(html_content.startswith('<!doctype html><html><head>'))
+        self.assertLess(html_content.index('https://example.com/page'), html_content.index('<title>'))
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import weakref
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError: # async fetches fall back to the requests sessions in worker threads
+    httpx = None
+
+
+_sessions      = OrderedDict() # (scheme, host) -> requests.Session, least recently used first
+_sessions_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary() # event loop -> httpx.AsyncClient
+
+RETRY_STATUSES = (502, 503, 504, )
+
+
+class UpstreamError(Exception):
+    pass
+
+
+def build_session():
+    retry = Retry(
+        total=settings.PROXY_UPSTREAM_RETRIES,
+        backoff_factor=settings.PROXY_UPSTREAM_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({'GET', 'HEAD', }), # only idempotent requests are retried
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=1, # a session serves a single upstream host
+        pool_maxsize=settings.PROXY_UPSTREAM_POOL_SIZE,
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def get_session(url):
+    parsed_url = urlparse(url)
+    key = (parsed_url.scheme, parsed_url.netloc)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = build_session()
+            while len(_sessions) > settings.PROXY_UPSTREAM_MAX_HOSTS:
+                _, evicted_session = _sessions.popitem(last=False)
+                evicted_session.close()
+        else:
+            _sessions.move_to_end(key)
+    return session
+
+def fetch(url, **kwargs):
+    kwargs.setdefault('timeout', (
+        settings.PROXY_UPSTREAM_CONNECT_TIMEOUT,
+        settings.PROXY_UPSTREAM_READ_TIMEOUT,
+    ))
+    return get_session(url).get(url, **kwargs)
+
+
+class ThreadedResponse:
+    """
+    Async view of a streamed requests response, every blocking read runs
+    in a worker thread. Same interface as httpx.Response.
+    """
+
+    def __init__(self, response):
+        self.response    = response
+        self.status_code = response.status_code
+        self.headers     = response.headers
+
+    async def _iterate(self, iterator):
+        next_chunk = sync_to_async(next, thread_sensitive=False)
+        while (chunk := await next_chunk(iterator, None)) is not None:
+            yield chunk
+
+    def aiter_raw(self, chunk_size):
+        return self._iterate(self.response.raw.stream(chunk_size, decode_content=False))
+
+    def aiter_bytes(self, chunk_size):
+        return self._iterate(self.response.iter_content(chunk_size))
+
+    @property
+    def num_bytes_downloaded(self): # body bytes read from the wire, before content decoding
+        return self.response.raw.tell()
+
+    async def aclose(self):
+        self.response.close()
+
+
+def get_async_client():
+    # an AsyncClient must not outlive its event loop, keep one per loop
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.PROXY_UPSTREAM_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.PROXY_UPSTREAM_POOL_SIZE * 10,
+            ),
+            timeout=httpx.Timeout(
+                settings.PROXY_UPSTREAM_READ_TIMEOUT,
+                connect=settings.PROXY_UPSTREAM_CONNECT_TIMEOUT,
+            ),
+        )
+    return client
+
+async def afetch(url, headers=None):
+    """
+    Non-blocking streamed GET. The returned response has `status_code`,
+    `headers`, `aiter_raw()`, `aiter_bytes()` and `aclose()`. Without
+    httpx the requests fetch runs in a worker thread instead.
+    """
+    if httpx is None:
+        try:
+            response = await sync_to_async(fetch, thread_sensitive=False)(url, stream=True, headers=headers)
+        except requests.exceptions.RequestException as e:
+            raise UpstreamError(str(e)) from e
+        return ThreadedResponse(response)
+
+    client = get_async_client()
+    for attempt in range(settings.PROXY_UPSTREAM_RETRIES + 1):
+        retries_left = attempt < settings.PROXY_UPSTREAM_RETRIES
+        try:
+            response = await client.send(client.build_request('GET', url, headers=headers), stream=True)
+        except httpx.TransportError as e:
+            if not retries_left:
+                raise UpstreamError(str(e)) from e
+        except httpx.HTTPError as e:
+            raise UpstreamError(str(e)) from e
+        else:
+            if response.status_code not in RETRY_STATUSES or not retries_left:
+                return response
+            await response.aclose()
+        await asyncio.sleep(settings.PROXY_UPSTREAM_BACKOFF * 2 ** attempt)
@@ -0,0 +1,107 @@
+import base64
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+
+
+TOKEN_PREFIX = '~' # never starts an encoded url, those start with "http"
+TOKEN_BYTES  = 9   # 12 characters of base64
+
+
+def _token_key(token):
+    return f'proxy:url_token:{token}'
+
+
+class UrlTokens:
+    """
+    Short tokens standing for upstream urls in rewritten pages, instead of
+    the percent-encoded url.
+
+    A token is a keyed BLAKE2 hash of the url, so the same url always gets
+    the same token and nobody without SECRET_KEY can make one up. The url
+    behind a token is kept in a per process LRU of `size` entries and in
+    the shared cache for `timeout` seconds, so every process can resolve
+    tokens of pages rewritten by the others. New tokens are written to the
+    shared cache in one batch by `flush()`, before the page that holds
+    them is served.
+    """
+
+    def __init__(self, size, timeout):
+        self.size     = size
+        self.timeout  = timeout
+        self._urls    = OrderedDict() # token -> (url, monotonic time it was last written to the shared cache)
+        self._pending = {}            # token -> url, not in the shared cache yet
+        self._lock    = threading.Lock()
+        self._key     = hashlib.sha256(b'app.url_tokens' + settings.SECRET_KEY.encode()).digest()
+
+    def sign(self, url):
+        digest = hashlib.blake2b(url.encode(), key=self._key, digest_size=TOKEN_BYTES).digest() # keyed, so a MAC
+        return TOKEN_PREFIX + base64.urlsafe_b64encode(digest).decode()
+
+    def _remember(self, token, url, published):
+        self._urls[token] = (url, published)
+        self._urls.move_to_end(token)
+        while len(self._urls) > self.size:
+            self._urls.popitem(last=False)
+
+    def encode(self, url):
+        token = self.sign(url)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._urls.get(token)
+            if entry and now - entry[1] < self.timeout / 2:
+                self._urls.move_to_end(token)
+            else: # new, or about to expire from the shared cache
+                self._remember(token, url, now)
+                self._pending[token] = url
+        return token
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            cache.set_many({_token_key(token): url for token, url in pending.items()}, timeout=self.timeout)
+
+    def decode(self, token):
+        """Url of `token`, None when it is unknown or forged."""
+        with self._lock:
+            entry = self._urls.get(token)
+            if entry is not None:
+                self._urls.move_to_end(token)
+                return entry[0]
+
+        url = cache.get(_token_key(token))
+        if url is None or not constant_time_compare(self.sign(url), token):
+            return None
+        with self._lock:
+            self._remember(token, url, float('-inf')) # written by another process, at an unknown time
+        return url
+
+
+_url_tokens      = None
+_url_tokens_lock = threading.Lock()
+
+
+def get_url_tokens():
+    global _url_tokens
+    with _url_tokens_lock:
+        if _url_tokens is None:
+            _url_tokens = UrlTokens(size=settings.PROXY_URL_TOKEN_MEMORY_SIZE, timeout=settings.PROXY_URL_TOKEN_TTL)
+    return _url_tokens
+
+def is_token(value):
+    return value.startswith(TOKEN_PREFIX)
+
+def encode_url(url):
+    return get_url_tokens().encode(url)
+
+def decode_url(token):
+    return get_url_tokens().decode(token)
+
+def flush_url_tokens():
+    get_url_tokens().flush()
@@ -1,8 +1,14 @@
+from django.conf import settings
 from django.urls import path
 
 from app import views
 
 
+if settings.PROXY_ASYNC_VIEWS:
+    proxy_view, static_proxy_view = views.AsyncProxyView, views.AsyncStaticProxyView
+else:
+    proxy_view, static_proxy_view = views.ProxyView, views.StaticProxyView
+
 urlpatterns = [
     path("settings", views.SettingsView.as_view(), name="settings"),
     path("login", views.CustomLoginView.as_view(), name="login"),
@@ -13,7 +19,9 @@ urlpatterns = [
     path("sites/", views.SiteAddView.as_view(), name='site_add'),
     path("sites/<uuid:id>/", views.SiteEditView.as_view(), name='site_edit'),
     path('sites/<uuid:id>/delete/', views.SiteDeleteView.as_view(), name='site_delete'),
+    path("metrics", views.MetricsView.as_view(), name='metrics'),
     
-    path('<str:name>/<str:url>/', views.ProxyView.as_view(), name='proxy'),
-    path('static_proxy/<str:name>/<str:url>/', views.StaticProxyView.as_view(), name='static_proxy'),
+    path('proxy_sw/<str:name>.js', views.ServiceWorkerView.as_view(), name='proxy_service_worker'),
+    path('<str:name>/<str:url>/', proxy_view.as_view(), name='proxy'),
+    path('static_proxy/<str:name>/<str:url>/', static_proxy_view.as_view(), name='static_proxy'),
 ]
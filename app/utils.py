@@ -1,6 +1,10 @@
+import re
 from urllib.parse import quote_plus
 
 
+CHARSET_RE = re.compile(r'charset=["\']?([\w-]+)', re.IGNORECASE) # in content-type headers and meta tags
+
+
 def urlencode(value, safe='~'):
     encoded_value = quote_plus(value, safe=safe)
     encoded_value = encoded_value            \
@@ -10,4 +14,4 @@ def urlencode(value, safe='~'):
                         .replace(':', '%3A') \
                         .replace('%', '%25')
 
-    return encoded_value
\ No newline at end of file
+    return encoded_value
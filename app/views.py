@@ -1,47 +1,75 @@
-import json
-import re
+import codecs
+import time
 import requests
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import get_object_or_404, redirect
-from django.http import Http404, HttpResponse
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
 from django.contrib.auth import (
     login as login_,
 )
 from django.contrib import messages
 from django.urls import reverse_lazy
+from django.utils.http import parse_etags
 from django.views.generic import View, ListView
 from django.views.generic.edit import FormView
 from django.contrib.auth.views import LoginView, LogoutView
 from django.contrib.auth.forms import UserCreationForm
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-
-from bs4 import BeautifulSoup
-from urllib.parse import unquote_plus, urlparse
+from urllib.parse import unquote_plus
 
+from app import upstream
+from app.asset_pass import issue_asset_pass, revoke_asset_pass
+from app.asset_cache import get_asset_cache, is_storable
+from app.cache import get_rendered_page, get_rewritten_css, set_rendered_page, set_rewritten_css
+from app.compression import compress_streaming_response, text_response
+from app.counters import count_traffic
+from app.driver_pool import DriverPoolExhausted
 from app.forms import SiteForm, CustomUserChangeForm
-from app.mixins import CustomLoginRequiredMixin
+from app import metrics
+from app.metrics import cache_result, observe_stage, stage
+from app.mixins import AssetPassRequiredMixin, CustomLoginRequiredMixin, StageTimingMixin
 from app.models import Site
-from app.utils import urlencode
+from app.pagination import SiteKeysetPaginator
+from app.render_queue import RenderQueueFull, RenderTimeout, arender, render
+from app.ranges import RangeNotSatisfiable, content_range, covers_whole_body, if_range_matches, parse_range
+from app.resolver import resolve_site
+from app.rewriter import CssRewriter
+from app.service_worker import proxy_name, service_worker_script
+from app.singleflight import FlightTimeout, asset_flights, page_flights
+from app.url_tokens import decode_url, is_token
+from app.utils import CHARSET_RE
 
 
 class HomeView(CustomLoginRequiredMixin, ListView):
     model = Site
     template_name = 'home.html'
     context_object_name = 'sites'
-    ordering = ['-visit_count']
     paginate_by = 20
 
     def get_queryset(self):
-        return (
-            self.model.objects
-                .filter(user=self.request.user)
-                .order_by(*self.get_ordering())
+        return self.model.objects.filter(user=self.request.user)
+
+    def paginate_queryset(self, queryset, page_size):
+        # keyset instead of OFFSET pages, see SiteKeysetPaginator
+        paginator = SiteKeysetPaginator(queryset, page_size)
+        page = paginator.page(
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+            last='last' in self.request.GET,
         )
+        return paginator, page, page.object_list, page.has_previous or page.has_next
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # counting stops at the limit, users with more sites see "limit+"
+        limit = settings.SITES_COUNT_LIMIT
+        context['sites_count'] = self.get_queryset()[:limit + 1].count()
+        context['sites_count_limited'] = context['sites_count'] > limit
+        context['sites_count'] = min(context['sites_count'], limit)
+        return context
 
 class CustomLoginView(LoginView):
     template_name = 'login.html'
@@ -79,7 +107,7 @@ class CustomLogoutView(LogoutView):
     def dispatch(self, request, *args, **kwargs):
         response = super().dispatch(request, *args, **kwargs)
         messages.info(request, 'You are successfully logged out!')
-        return response
+        return revoke_asset_pass(response)
 
 class SettingsView(CustomLoginRequiredMixin, FormView):
     template_name = 'settings.html'
@@ -143,118 +171,579 @@ class SiteDeleteView(CustomLoginRequiredMixin, View):
         messages.success(request, f"You have successfully deleted site '{site.name}' !")
         return redirect('home')
 
-class ProxyView(CustomLoginRequiredMixin, View):
+def upstream_url(url):
+    # proxy urls hold the percent-encoded upstream url, or a token of it
+    if is_token(url):
+        decoded_url = decode_url(url)
+        if decoded_url is None:
+            raise Http404('Unknown or expired url token')
+        return decoded_url.removesuffix('/')
+    return unquote_plus(url).removesuffix('/')
+
+class ProxyView(StageTimingMixin, CustomLoginRequiredMixin, View):
+    metrics_view = 'proxy'
+
     def get(self, request, name, url):
         unquoted_name = unquote_plus(name)
-        unquoted_url = unquote_plus(url).removesuffix('/')
+        unquoted_url = upstream_url(url)
         
         try:
-            chrome_options = Options()
+            with stage('site'):
+                site = resolve_site(unquoted_name)
+            site_url = site.url.removesuffix('/')
+
+            total_traffic = 0
+            with stage('cache'):
+                html_content = get_rendered_page(site.pk, unquoted_url)
+            cache_result('page', html_content is not None)
+            if html_content is None:
+                with stage('render'):
+                    (html_content, total_traffic), shared = page_flights.do(
+                        (site.pk, unquoted_url),
+                        lambda: self.render_page(unquoted_url, name, site),
+                        settings.PROXY_COALESCE_PAGE_TIMEOUT,
+                    )
+                if shared: # rendered for another request, which counted the traffic
+                    total_traffic = 0
             
-            chrome_options.add_argument('--headless')  # run in background                                                                     
-            chrome_options.add_argument('--ignore-certificate-errors')
-            # for running in docker container
-            chrome_options.add_argument('--no-sandbox')
-            chrome_options.add_argument('--disable-gpu')
-            chrome_options.add_argument('--disable-dev-shm-usage')
-            chrome_options.add_argument('--start-maximized')
-            chrome_options.set_capability( 
-                'goog:loggingPrefs',       # for getting performance and network  
-                {'performance': 'ALL'}     # chrome devtools protocol logs
-            ) 
-
-            driver = webdriver.Chrome(options=chrome_options) 
-            try: 
-                site = Site.objects.get(name=unquoted_name)
-                site_url = site.url.removesuffix('/')
-                parsed_site_url = urlparse(site_url)
-                host = parsed_site_url.netloc
-                host_with_protocol = '{url.scheme}://{url.netloc}'.format(url=parsed_site_url)
-                
-                driver.execute_cdp_cmd('Network.enable', {}) # allow CDP network logs
-                driver.get(unquoted_url)
-                WebDriverWait(driver, 10) \
-                    .until(
-                        EC.presence_of_element_located((By.TAG_NAME, 'link'))
-                    ) # wait for full load of page
-                
-                performance_logs = driver.get_log('performance')
-                performance_list = [
-                    json.loads(log['message'].lower())['message']
-                    for log in performance_logs
-                ]
-                
-                total_traffic = sum([
-                    int(log["params"]["response"]["headers"].get("content-length", 0))
-                    for log in performance_list
-                    if log["method"] == "network.responsereceived"
-                ])
-                
-                html_content = driver.page_source
-                soup = BeautifulSoup(html_content, 'html.parser')
-                
-                for tag in soup.find_all(['a', 'script', 'link', 'meta', 'img',]):
-                    new_path_chunk = f'/{name}/'
-                    if tag.name != 'a':
-                        new_path_chunk = '/static_proxy' + new_path_chunk
-                    for tag_attr in ['href', 'src', 'content', 'data-src',]:
-                        if tag_attr in tag.attrs:
-                            old_tag_attr_val = tag.get(tag_attr, '')
-                            if old_tag_attr_val.startswith('/'):
-                                tag[tag_attr] = new_path_chunk + urlencode(host_with_protocol + old_tag_attr_val)
-                            elif host in old_tag_attr_val:
-                                tag[tag_attr] = new_path_chunk + urlencode(old_tag_attr_val)
-
-                    if tag.get('srcset'):
-                        tags_attr_chunks = []
-                        new_path_chunk = f'/static_proxy/{name}/'
-                        for tag_attr_chunk_val in tag['srcset'].split(' '):
-                            if tag_attr_chunk_val.startswith('/'):
-                                tag_attr_chunk_val = new_path_chunk + urlencode(f"{host_with_protocol}{tag_attr_chunk_val}")
-                            elif host in tag_attr_chunk_val:
-                                tag_attr_chunk_val = new_path_chunk + urlencode(tag_attr_chunk_val)
-                            tags_attr_chunks.append(tag_attr_chunk_val)
-                        tag['srcset'] = " ".join(tags_attr_chunks)
-                        
-                html_content = str(soup)
-                
-                if site_url == unquoted_url:
-                    site.visit_count += 1
-                    site.routed_data_amount += total_traffic
-                    site.save()
-                
-                return HttpResponse(html_content)
-            except Exception as e:
-                raise e
-            finally:
-                driver.quit()
-        except Exception as e:
-            message = f"Cant load '{unquoted_name}'  site " \
-                                f"with '{unquoted_url}' url. "  \
-                                "Make sure that url is correct."
-            messages.error(request, message)
-            return redirect('home')
-
-class StaticProxyView(CustomLoginRequiredMixin, View):
+            if site_url == unquoted_url:
+                with stage('count'):
+                    count_traffic(site.pk, visits=1, routed_bytes=total_traffic)
+            
+            with stage('compress'):
+                response = text_response(request, html_content, settings.PROXY_PAGE_CACHE_TTL)
+            return issue_asset_pass(request, response) # lets the assets of the page skip the session
+        except (DriverPoolExhausted, RenderQueueFull, RenderTimeout, FlightTimeout, ):
+            return self.busy_response(request)
+        except Exception:
+            return self.error_response(request, unquoted_name, unquoted_url)
+
+    def render_page(self, url, name, site):
+        html_content, total_traffic = render(url, name, site)
+        set_rendered_page(site.pk, url, html_content)
+        return html_content, total_traffic
+
+    def busy_response(self, request):
+        messages.error(request, "Proxy is busy right now. Please try again in a moment.")
+        return redirect('home')
+
+    def error_response(self, request, unquoted_name, unquoted_url):
+        message = f"Cant load '{unquoted_name}'  site " \
+                            f"with '{unquoted_url}' url. "  \
+                            "Make sure that url is correct."
+        messages.error(request, message)
+        return redirect('home')
+
+class AsyncProxyView(ProxyView):
+    async def get(self, request, name, url):
+        unquoted_name = unquote_plus(name)
+        unquoted_url = upstream_url(url) if not is_token(url) else await sync_to_async(upstream_url)(url)
+
+        try:
+            with stage('site'):
+                site = await sync_to_async(resolve_site)(unquoted_name)
+            site_url = site.url.removesuffix('/')
+
+            total_traffic = 0
+            with stage('cache'):
+                html_content = await sync_to_async(get_rendered_page)(site.pk, unquoted_url)
+            cache_result('page', html_content is not None)
+            if html_content is None:
+                with stage('render'):
+                    (html_content, total_traffic), shared = await page_flights.ado(
+                        (site.pk, unquoted_url),
+                        lambda: self.arender_page(unquoted_url, name, site),
+                        settings.PROXY_COALESCE_PAGE_TIMEOUT,
+                    )
+                if shared:
+                    total_traffic = 0
+
+            if site_url == unquoted_url:
+                with stage('count'):
+                    await sync_to_async(count_traffic)(site.pk, visits=1, routed_bytes=total_traffic)
+
+            with stage('compress'):
+                response = await sync_to_async(text_response, thread_sensitive=False)(
+                    request, html_content, settings.PROXY_PAGE_CACHE_TTL
+                )
+            return issue_asset_pass(request, response)
+        except (DriverPoolExhausted, RenderQueueFull, RenderTimeout, FlightTimeout, ):
+            return self.busy_response(request)
+        except Exception:
+            return self.error_response(request, unquoted_name, unquoted_url)
+
+    async def arender_page(self, url, name, site):
+        html_content, total_traffic = await arender(url, name, site)
+        await sync_to_async(set_rendered_page)(site.pk, url, html_content)
+        return html_content, total_traffic
+
+class FetchedAsset:
+    """
+    Outcome of an upstream fetch of an asset, shared by the requests that
+    waited for it: a revalidated cache entry, a body read whole, or the
+    open upstream response of a body too large, or of unknown size, to
+    hold in memory.
+    """
+
+    def __init__(self, status_code=200, headers=None, cached_asset=None):
+        self.status_code  = status_code
+        self.headers      = headers or {}
+        self.cached_asset = cached_asset
+        self.body         = None
+        self.response     = None
+
+    @property
+    def content_type(self):
+        return self.headers.get('content-type', '')
+
+    @property
+    def is_css(self):
+        return self.content_type.startswith('text/css')
+
+    @property
+    def is_small(self):
+        content_length = self.headers.get('content-length', '')
+        return content_length.isdigit() and int(content_length) <= settings.PROXY_COALESCE_MAX_BYTES
+
+class StaticProxyView(StageTimingMixin, AssetPassRequiredMixin, View):
+    metrics_view        = 'static_proxy'
+    passthrough_headers = (
+        'Content-Length', 'Content-Encoding', 'Content-Range', 'Accept-Ranges',
+        'Cache-Control', 'ETag', 'Last-Modified', 'Expires',
+    )
+    chunk_size          = 64 * 1024
+    css_content_type    = 'text/css; charset=utf-8'
+
     def get(self, request, name, url):
-        unquoted_url = unquote_plus(url).removesuffix('/')
+        unquoted_url = upstream_url(url)
+
+        with stage('cache'):
+            rewritten_css = get_rewritten_css(name, unquoted_url)
+            if rewritten_css is None:
+                asset_cache = get_asset_cache()
+                cached_asset = asset_cache.lookup(unquoted_url) if asset_cache else None
+        if rewritten_css is not None:
+            cache_result('css', True)
+            return text_response(request, rewritten_css, settings.PROXY_CSS_CACHE_TTL, content_type=self.css_content_type)
+
+        cache_result('asset', bool(cached_asset and cached_asset.is_fresh()))
+        if cached_asset and cached_asset.is_fresh():
+            cached_response = self.cached_response(request, cached_asset)
+            if cached_response:
+                return cached_response
+            cached_asset = None
+
+        if request.headers.get('Range'):
+            return self.range_response(request, name, unquoted_url, asset_cache, cached_asset)
     
         try: 
-            response = requests.get(unquoted_url)
-            content_type = response.headers.get('content-type')
-            
-            if content_type.startswith('text/css'):
-                content = response.text
-                
-                url_pattern = re.compile(r'url\((.*?)\)')
-                matches = url_pattern.findall(content)
-                for old_url in matches:
-                    old_relative_path = urlparse(old_url).path
-                    new_url = f'/static_proxy/{name}/{urlencode(old_relative_path)}'
-                    
-                    content = content.replace(f'url({old_url})', f'url({new_url})')
-            else:
-                content = response.content  
-            return HttpResponse(content, content_type=content_type)
+            with stage('upstream'):
+                try: # concurrent requests of the asset wait for one upstream fetch
+                    fetched, shared = asset_flights.do(
+                        (name, unquoted_url),
+                        lambda: self.fetch(name, unquoted_url, asset_cache, cached_asset),
+                        settings.PROXY_COALESCE_ASSET_TIMEOUT,
+                    )
+                except FlightTimeout:
+                    fetched, shared = self.fetch(name, unquoted_url, asset_cache, cached_asset), False
+                if shared and fetched.response is not None: # too large to share, fetched for the first request only
+                    fetched = self.fetch(name, unquoted_url, asset_cache, cached_asset)
+            if fetched.cached_asset:
+                cached_response = self.cached_response(request, fetched.cached_asset)
+                if cached_response:
+                    return cached_response
+                fetched = self.fetch(name, unquoted_url, asset_cache, None)
+        except requests.exceptions.RequestException:
+            raise Http404('Resource not found')
+
+        return self.fetched_response(request, fetched, name, asset_cache, unquoted_url)
+
+    def fetch(self, name, url, asset_cache, cached_asset):
+        """
+        Gets `url` from upstream, revalidating `cached_asset` if there is
+        one. Bodies of a known size up to PROXY_COALESCE_MAX_BYTES are read
+        whole, so every request waiting for the fetch can be answered with
+        them.
+        """
+        response = upstream.fetch(
+            url,
+            stream=True,
+            headers=cached_asset.revalidation_headers() if cached_asset else None,
+        )
+        if cached_asset and response.status_code == 304:
+            response.close()
+            return FetchedAsset(cached_asset=asset_cache.refresh(cached_asset, response.headers))
+
+        fetched = FetchedAsset(response.status_code, response.headers)
+        if not fetched.is_small:
+            fetched.response = response
+        elif fetched.is_css:
+            fetched.body = b''.join(self.css_content(response, name, url))
+        else:
+            fetched.body = b''.join(self.raw_content(response, name, asset_cache, url))
+        return fetched
+
+    def range_response(self, request, name, url, asset_cache, cached_asset):
+        """
+        Range request of an asset that is not cached: only the range is
+        fetched from upstream and relayed, so seeking in media costs the
+        bytes that are watched. Ranges are neither shared nor stored,
+        unless the range is the whole body.
+        """
+        try:
+            with stage('upstream'):
+                response = upstream.fetch(url, stream=True, headers=self.range_headers(request, cached_asset))
+                if cached_asset and response.status_code == 304:
+                    response.close()
+                    cached_response = self.cached_response(
+                        request, asset_cache.refresh(cached_asset, response.headers)
+                    )
+                    if cached_response:
+                        return cached_response
+                    response = upstream.fetch(url, stream=True, headers=self.range_headers(request, None))
+                content_type = response.headers.get('content-type', '')
+                if content_type.startswith('text/css') and response.status_code == 206: # rewritten, so served whole
+                    response.close()
+                    response = upstream.fetch(url, stream=True)
         except requests.exceptions.RequestException:
             raise Http404('Resource not found')
+
+        if content_type.startswith('text/css'):
+            return self.css_response(response, name, url)
+        return self.stream_response(response, content_type, name, asset_cache, url)
+
+    def range_headers(self, request, cached_asset):
+        headers = {'Range': request.headers['Range']}
+        if_range = request.headers.get('If-Range')
+        if if_range and cached_asset and if_range.strip() == cached_asset.etag and cached_asset.headers.get('ETag'):
+            if_range = cached_asset.headers['ETag'] # the browser got the content hash from us, upstream knows its own etag
+        if if_range:
+            headers['If-Range'] = if_range
+        if cached_asset: # stale, a 304 lets the range be served from the cache
+            headers.update(cached_asset.revalidation_headers())
+        return headers
+
+    def fetched_response(self, request, fetched, name, asset_cache, url):
+        if fetched.response is not None and fetched.is_css:
+            return self.css_response(fetched.response, name, url)
+        if fetched.response is not None:
+            return self.stream_response(fetched.response, fetched.content_type, name, asset_cache, url)
+        if fetched.is_css:
+            cache_result('css', False)
+            return text_response(
+                request, fetched.body, settings.PROXY_CSS_CACHE_TTL,
+                content_type=self.css_content_type, status=fetched.status_code,
+            )
+        response = HttpResponse(fetched.body, content_type=fetched.content_type, status=fetched.status_code)
+        for header in self.passthrough_headers:
+            if header in fetched.headers:
+                response[header] = fetched.headers[header]
+        return response
+
+    def count_routed_bytes(self, name, routed_bytes):
+        count_traffic(site_name=unquote_plus(name), routed_bytes=routed_bytes)
+
+    def css_decoder(self, response):
+        charset = CHARSET_RE.search(response.headers.get('content-type', ''))
+        try:
+            return codecs.getincrementaldecoder(charset.group(1) if charset else 'utf-8')(errors='replace')
+        except LookupError:
+            return codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def css_content(self, response, name, url):
+        decoder = self.css_decoder(response)
+        css_rewriter = CssRewriter(name, url)
+        storable = is_storable(response.status_code, response.headers)
+
+        def decoded_content():
+            for chunk in response.iter_content(self.chunk_size):
+                yield decoder.decode(chunk)
+            yield decoder.decode(b'', final=True)
+
+        rewritten_chunks = []
+        rewritten_size = 0
+        started = time.perf_counter()
+        try:
+            for chunk in css_rewriter.rewrite_chunks(decoded_content()):
+                if storable and rewritten_size <= settings.PROXY_CSS_CACHE_MAX_BYTES:
+                    rewritten_chunks.append(chunk)
+                    rewritten_size += len(chunk)
+                yield chunk.encode()
+            if storable and rewritten_size <= settings.PROXY_CSS_CACHE_MAX_BYTES:
+                set_rewritten_css(name, url, ''.join(rewritten_chunks))
+        finally:
+            self.count_routed_bytes(name, response.raw.tell())
+            response.close()
+            observe_stage(self.metrics_view, 'stream', time.perf_counter() - started)
+
+    def css_response(self, response, name, url):
+        cache_result('css', False)
+        return compress_streaming_response(self.request, StreamingHttpResponse(
+            self.css_content(response, name, url),
+            content_type=self.css_content_type,
+            status=response.status_code,
+        ))
+
+    def raw_content(self, response, name, asset_cache, url):
+        started = time.perf_counter()
+        try: # raw bytes, so Content-Encoding and Content-Length stay valid
+            chunks = response.raw.stream(self.chunk_size, decode_content=False)
+            if asset_cache:
+                chunks = asset_cache.store_stream(url, self.storable_status(response), response.headers, chunks)
+            yield from chunks
+        finally:
+            self.count_routed_bytes(name, response.raw.tell())
+            response.close()
+            observe_stage(self.metrics_view, 'stream', time.perf_counter() - started)
+
+    def storable_status(self, response):
+        if response.status_code == 206 and covers_whole_body(response.headers.get('Content-Range')):
+            return 200
+        return response.status_code
+
+    def stream_response(self, response, content_type, name, asset_cache=None, url=None):
+        proxy_response = StreamingHttpResponse(
+            self.raw_content(response, name, asset_cache, url),
+            content_type=content_type,
+            status=response.status_code,
+        )
+        for header in self.passthrough_headers:
+            if header in response.headers:
+                proxy_response[header] = response.headers[header]
+        return proxy_response
+
+    def file_content(self, asset_file, length=None):
+        with asset_file:
+            remaining = length
+            while chunk := asset_file.read(self.chunk_size if remaining is None else min(self.chunk_size, remaining)):
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def cached_response(self, request, cached_asset):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match:
+            etags = [etag.removeprefix('W/') for etag in parse_etags(if_none_match)]
+            if '*' in etags or cached_asset.etag in etags or cached_asset.headers.get('ETag') in etags:
+                response = HttpResponseNotModified()
+                self.set_cached_headers(response, cached_asset)
+                return response
+
+        try:
+            byte_range = self.requested_range(request, cached_asset)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{cached_asset.size}'
+            return response
+
+        try:
+            asset_file = cached_asset.open()
+        except OSError: # evicted in the meantime
+            return None
+
+        if byte_range is None:
+            response = StreamingHttpResponse(
+                self.file_content(asset_file),
+                content_type=cached_asset.headers.get('Content-Type'),
+            )
+            response['Content-Length'] = cached_asset.size
+        else:
+            first, last = byte_range
+            asset_file.seek(first)
+            response = StreamingHttpResponse(
+                self.file_content(asset_file, last - first + 1),
+                content_type=cached_asset.headers.get('Content-Type'),
+                status=206,
+            )
+            response['Content-Length'] = last - first + 1
+            response['Content-Range'] = content_range(first, last, cached_asset.size)
+        response['Accept-Ranges'] = 'bytes'
+        if cached_asset.headers.get('Content-Encoding'):
+            response['Content-Encoding'] = cached_asset.headers['Content-Encoding']
+        self.set_cached_headers(response, cached_asset)
+        return response
+
+    def requested_range(self, request, cached_asset):
+        etags = (cached_asset.etag, cached_asset.headers.get('ETag'), )
+        if not if_range_matches(request.headers.get('If-Range'), etags, cached_asset.headers.get('Last-Modified')):
+            return None
+        return parse_range(request.headers.get('Range'), cached_asset.size)
+
+    def set_cached_headers(self, response, cached_asset):
+        response['ETag'] = cached_asset.etag
+        for header in ('Cache-Control', 'Expires', 'Last-Modified', ):
+            if cached_asset.headers.get(header):
+                response[header] = cached_asset.headers[header]
+
+class AsyncStaticProxyView(StaticProxyView):
+    """
+    StaticProxyView for ASGI. Upstream bodies are read with a non-blocking
+    client and every response body is an async iterator, so an in-flight
+    asset holds no worker thread.
+    """
+
+    async def get(self, request, name, url):
+        unquoted_url = upstream_url(url) if not is_token(url) else await sync_to_async(upstream_url)(url)
+
+        with stage('cache'):
+            rewritten_css = await sync_to_async(get_rewritten_css)(name, unquoted_url)
+            if rewritten_css is None:
+                asset_cache = get_asset_cache()
+                cached_asset = await sync_to_async(asset_cache.lookup, thread_sensitive=False)(unquoted_url) if asset_cache else None
+        if rewritten_css is not None:
+            cache_result('css', True)
+            return await sync_to_async(text_response, thread_sensitive=False)(
+                request, rewritten_css, settings.PROXY_CSS_CACHE_TTL, content_type=self.css_content_type,
+            )
+
+        cache_result('asset', bool(cached_asset and cached_asset.is_fresh()))
+        if cached_asset and cached_asset.is_fresh():
+            cached_response = await self.acached_response(request, cached_asset)
+            if cached_response:
+                return cached_response
+            cached_asset = None
+
+        if request.headers.get('Range'):
+            return await self.arange_response(request, name, unquoted_url, asset_cache, cached_asset)
+
+        try:
+            with stage('upstream'):
+                try:
+                    fetched, shared = await asset_flights.ado(
+                        (name, unquoted_url),
+                        lambda: self.afetch(name, unquoted_url, asset_cache, cached_asset),
+                        settings.PROXY_COALESCE_ASSET_TIMEOUT,
+                    )
+                except FlightTimeout:
+                    fetched, shared = await self.afetch(name, unquoted_url, asset_cache, cached_asset), False
+                if shared and fetched.response is not None:
+                    fetched = await self.afetch(name, unquoted_url, asset_cache, cached_asset)
+            if fetched.cached_asset:
+                cached_response = await self.acached_response(request, fetched.cached_asset)
+                if cached_response:
+                    return cached_response
+                fetched = await self.afetch(name, unquoted_url, asset_cache, None)
+        except upstream.UpstreamError:
+            raise Http404('Resource not found')
+
+        return await self.afetched_response(request, fetched, name, asset_cache, unquoted_url)
+
+    async def arange_response(self, request, name, url, asset_cache, cached_asset):
+        try:
+            with stage('upstream'):
+                response = await upstream.afetch(url, headers=self.range_headers(request, cached_asset))
+                if cached_asset and response.status_code == 304:
+                    await response.aclose()
+                    cached_response = await self.acached_response(
+                        request, await sync_to_async(asset_cache.refresh, thread_sensitive=False)(cached_asset, response.headers)
+                    )
+                    if cached_response:
+                        return cached_response
+                    response = await upstream.afetch(url, headers=self.range_headers(request, None))
+                content_type = response.headers.get('content-type', '')
+                if content_type.startswith('text/css') and response.status_code == 206:
+                    await response.aclose()
+                    response = await upstream.afetch(url)
+        except upstream.UpstreamError:
+            raise Http404('Resource not found')
+
+        if content_type.startswith('text/css'):
+            return self.css_response(response, name, url)
+        return self.stream_response(response, content_type, name, asset_cache, url)
+
+    async def afetch(self, name, url, asset_cache, cached_asset):
+        response = await upstream.afetch(
+            url,
+            headers=cached_asset.revalidation_headers() if cached_asset else None,
+        )
+        if cached_asset and response.status_code == 304:
+            await response.aclose()
+            cached_asset = await sync_to_async(asset_cache.refresh, thread_sensitive=False)(cached_asset, response.headers)
+            return FetchedAsset(cached_asset=cached_asset)
+
+        fetched = FetchedAsset(response.status_code, response.headers)
+        if not fetched.is_small:
+            fetched.response = response
+        elif fetched.is_css:
+            fetched.body = b''.join([chunk async for chunk in self.css_content(response, name, url)])
+        else:
+            fetched.body = b''.join([chunk async for chunk in self.raw_content(response, name, asset_cache, url)])
+        return fetched
+
+    async def css_content(self, response, name, url):
+        decoder = self.css_decoder(response)
+        css_rewriter = CssRewriter(name, url)
+        storable = is_storable(response.status_code, response.headers)
+
+        rewritten_chunks = []
+        rewritten_size = 0
+        started = time.perf_counter()
+        try:
+            async for chunk in response.aiter_bytes(self.chunk_size):
+                rewritten = css_rewriter.feed(decoder.decode(chunk))
+                if storable and rewritten_size <= settings.PROXY_CSS_CACHE_MAX_BYTES:
+                    rewritten_chunks.append(rewritten)
+                    rewritten_size += len(rewritten)
+                if rewritten:
+                    yield rewritten.encode()
+            rewritten = css_rewriter.feed(decoder.decode(b'', final=True)) + css_rewriter.close()
+            rewritten_chunks.append(rewritten)
+            rewritten_size += len(rewritten)
+            if rewritten:
+                yield rewritten.encode()
+            if storable and rewritten_size <= settings.PROXY_CSS_CACHE_MAX_BYTES:
+                await sync_to_async(set_rewritten_css)(name, url, ''.join(rewritten_chunks))
+        finally:
+            await response.aclose()
+            await sync_to_async(self.count_routed_bytes)(name, response.num_bytes_downloaded)
+            observe_stage(self.metrics_view, 'stream', time.perf_counter() - started)
+
+    async def raw_content(self, response, name, asset_cache, url):
+        started = time.perf_counter()
+        try:
+            chunks = response.aiter_raw(self.chunk_size)
+            if asset_cache:
+                chunks = asset_cache.astore_stream(url, self.storable_status(response), response.headers, chunks)
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose() # a client that went away leaves it unfinished, the cache writer is aborted now
+            await response.aclose()
+            await sync_to_async(self.count_routed_bytes)(name, response.num_bytes_downloaded)
+            observe_stage(self.metrics_view, 'stream', time.perf_counter() - started)
+
+    async def afetched_response(self, request, fetched, name, asset_cache, url):
+        # small css is compressed, with its variant read from or written to the cache
+        return await sync_to_async(self.fetched_response, thread_sensitive=False)(request, fetched, name, asset_cache, url)
+
+    async def acached_response(self, request, cached_asset):
+        # opens the cached file, which is disk work, in a worker thread
+        return await sync_to_async(self.cached_response, thread_sensitive=False)(request, cached_asset)
+
+    async def file_content(self, asset_file, length=None):
+        read = sync_to_async(asset_file.read, thread_sensitive=False)
+        remaining = length
+        try:
+            while chunk := await read(self.chunk_size if remaining is None else min(self.chunk_size, remaining)):
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            asset_file.close()
+
+class ServiceWorkerView(CustomLoginRequiredMixin, View):
+    def get(self, request, name):
+        try:
+            site = resolve_site(name)
+        except Site.DoesNotExist:
+            raise Http404('Site not found')
+        response = HttpResponse(service_worker_script(site), content_type='text/javascript; charset=utf-8')
+        response['Service-Worker-Allowed'] = f'/{proxy_name(site)}/' # scope of the proxied pages of the site
+        response['Cache-Control'] = 'no-cache' # browsers check for updates of the worker
+        return response
+
+class MetricsView(CustomLoginRequiredMixin, View):
+    def get(self, request):
+        if not request.user.is_staff:
+            raise PermissionDenied
+        return HttpResponse(metrics.expose(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,405 @@
+"""
+Latency and throughput of ProxyView and StaticProxyView against the local
+stand-in upstream (benchmarks.upstream), started in a child process.
+
+    python -m benchmarks.proxy
+    python -m benchmarks.proxy --concurrency 16 --requests 1000 --output results.json
+    python -m benchmarks.proxy --live --compare benchmarks/results/before.json
+
+Requests go through the Django test client, or with --live through a
+threaded WSGI server over real sockets. The proxy runs on its own sqlite
+database, cache and asset cache directory in a temporary directory. Pages
+are rendered with --render-mode (http by default, browser needs Chrome).
+
+Scenarios:
+    page    entry pages through ProxyView
+    static  every asset the pages link to through StaticProxyView
+    visit   a page followed by all of its assets, like a browser does
+
+For each one the latency percentiles, throughput, peak RSS of the process
+and the time spent per stage (from the Server-Timing headers) are printed
+and saved as json. --compare prints the change against an earlier result
+file.
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import re
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from benchmarks import upstream
+
+
+RESULTS_DIR         = Path(__file__).resolve().parent / 'results'
+PAGES               = ('fanout', 'article', 'listing', )
+SITE_NAME           = 'bench'
+STATIC_PROXY_URL_RE = re.compile(r'/static_proxy/[^/"\'\s]+/[^/"\'\s)]+')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_upstream(options):
+    upstream_options = upstream.build_parser().parse_args([
+        '--port', str(free_port()),
+        '--latency', str(options.upstream_latency),
+        '--large-bytes', str(options.large_bytes),
+    ])
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=upstream.serve, args=(upstream_options, ready), daemon=True)
+    process.start()
+    ready.wait(10)
+    return process, f'http://{upstream_options.host}:{upstream_options.port}'
+
+def setup_django(work_dir, options):
+    os.environ.update({
+        'DJANGO_SETTINGS_MODULE': 'free_vpn.settings',
+        'SECRET_KEY':             'benchmark',
+        'DATABASE_URL':           f'sqlite:///{work_dir / "db.sqlite3"}',
+        'CACHE_URL':              'locmemcache://',
+        'CACHE_MAX_ENTRIES':      '100000',
+        'PROXY_ASSET_CACHE_DIR':  str(work_dir / 'assets'),
+        'PROXY_ASYNC_VIEWS':      'False',
+    })
+    if options.no_cache:
+        os.environ.update({
+            'PROXY_PAGE_CACHE_TTL':      '0',
+            'PROXY_CSS_CACHE_TTL':       '0',
+            'PROXY_ASSET_CACHE_ENABLED': 'False',
+        })
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+
+
+class Stages:
+    """
+    Time spent in the stages of the proxied requests, summed from their
+    Server-Timing headers (see app.metrics). Nested stages are counted in
+    both, e.g. `rewrite` is part of `render`.
+    """
+
+    def __init__(self):
+        self.totals = {}
+        self.counts = {}
+        self._lock  = threading.Lock()
+
+    def add_server_timing(self, header):
+        for entry in filter(None, (header or '').split(',')):
+            name, _, duration = entry.strip().partition(';dur=')
+            if name != 'total' and duration:
+                self.add(name, float(duration) / 1000)
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.totals[stage] = self.totals.get(stage, 0) + seconds
+            self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self.totals, self.counts = {}, {}
+
+    def summary(self, requests):
+        return {
+            stage: {
+                'calls':          self.counts[stage],
+                'total_ms':       round(total * 1000, 2),
+                'ms_per_request': round(total * 1000 / requests, 3),
+            }
+            for stage, total in sorted(self.totals.items())
+        }
+
+
+class TestClientTransport:
+    def __init__(self, user, stages):
+        self.user   = user
+        self.stages = stages
+        self._local = threading.local()
+
+    def client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            from django.test import Client
+            client = self._local.client = Client(HTTP_HOST='localhost')
+            client.force_login(self.user)
+        return client
+
+    def get(self, path):
+        response = self.client().get(path)
+        self.stages.add_server_timing(response.get('Server-Timing'))
+        size = 0
+        if response.streaming:
+            for chunk in response.streaming_content:
+                size += len(chunk)
+        else:
+            size = len(response.content)
+        response.close()
+        return response.status_code, size
+
+    def content(self, path):
+        return self.client().get(path).content
+
+    def close(self):
+        pass
+
+
+class LiveServerTransport:
+    def __init__(self, user, stages):
+        import requests
+        from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+        from django.core.wsgi import get_wsgi_application
+        from django.test import Client
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        self.requests = requests
+        self.stages = stages
+        self.server = ThreadedWSGIServer(('127.0.0.1', free_port()), QuietHandler)
+        self.server.set_app(get_wsgi_application())
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+
+        login_client = Client()
+        login_client.force_login(user)
+        self.cookies = {name: cookie.value for name, cookie in login_client.cookies.items()}
+        self._local = threading.local()
+
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self.requests.Session()
+            session.cookies.update(self.cookies)
+        return session
+
+    def get(self, path):
+        response = self.session().get(self.base_url + path, allow_redirects=False)
+        self.stages.add_server_timing(response.headers.get('Server-Timing'))
+        return response.status_code, len(response.content)
+
+    def content(self, path):
+        return self.session().get(self.base_url + path).content
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+def run_scenario(transport, stages, paths, options):
+    # every scenario runs its paths once unmeasured first, so caches, pools
+    # and sessions are in the state they would be in on a busy server
+    for path in paths:
+        transport.get(path)
+    stages.reset()
+
+    schedule = [paths[i % len(paths)] for i in range(options.requests)]
+    latencies = []
+    errors = 0
+    transferred = 0
+    lock = threading.Lock()
+
+    def request(path):
+        nonlocal errors, transferred
+        started = time.perf_counter()
+        status_code, size = transport.get(path)
+        latency = time.perf_counter() - started
+        with lock:
+            latencies.append(latency)
+            transferred += size
+            errors += status_code >= 400
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options.concurrency) as executor:
+        list(executor.map(request, schedule))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests':        len(latencies),
+        'errors':          errors,
+        'elapsed_s':       round(elapsed, 3),
+        'throughput_rps':  round(len(latencies) / elapsed, 2),
+        'throughput_mbps': round(transferred / elapsed / 1e6, 2),
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies) * 1000, 2),
+            'p50':  round(percentile(latencies, 0.50) * 1000, 2),
+            'p95':  round(percentile(latencies, 0.95) * 1000, 2),
+            'p99':  round(percentile(latencies, 0.99) * 1000, 2),
+            'max':  round(latencies[-1] * 1000, 2),
+        },
+        'peak_rss_mb':     round(peak_rss() / 1e6, 1),
+        'stages':          stages.summary(len(latencies)),
+    }
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on linux and in bytes on macos
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+def page_paths(upstream_url):
+    from app.utils import urlencode
+    return [f'/{SITE_NAME}/{urlencode(f"{upstream_url}/{page}.html")}/' for page in PAGES]
+
+def asset_paths(transport, upstream_url, pages):
+    from app.utils import urlencode
+    local_prefix = urlencode(upstream_url)
+    paths = {}
+    for page in pages:
+        html_content = transport.content(page).decode()
+        paths[page] = [
+            link.rstrip('/') + '/'
+            for link in dict.fromkeys(STATIC_PROXY_URL_RE.findall(html_content))
+            if f'/{local_prefix}' in link
+        ]
+    return paths
+
+class VisitTransport:
+    """
+    A visit is one request for a page followed by requests for all of its
+    assets, made one after another like a browser tab does.
+    """
+
+    def __init__(self, transport, asset_paths_by_page):
+        self.transport           = transport
+        self.asset_paths_by_page = asset_paths_by_page
+
+    def get(self, page):
+        status_code, size = self.transport.get(page)
+        for path in self.asset_paths_by_page[page]:
+            asset_status, asset_size = self.transport.get(path)
+            status_code = max(status_code, asset_status)
+            size += asset_size
+        return status_code, size
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results):
+    print(f"{'scenario':<8} {'requests':>8} {'errors':>6} {'req/s':>8} {'MB/s':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RSS MB':>7}")
+    for name, stats in results['scenarios'].items():
+        latency = stats['latency_ms']
+        print(
+            f"{name:<8} {stats['requests']:>8} {stats['errors']:>6} {stats['throughput_rps']:>8.1f} "
+            f"{stats['throughput_mbps']:>7.1f} {latency['p50']:>8.2f} {latency['p95']:>8.2f} "
+            f"{latency['p99']:>8.2f} {stats['peak_rss_mb']:>7.1f}"
+        )
+        for stage, stage_stats in stats['stages'].items():
+            print(f"    {stage:<10} {stage_stats['calls']:>6} calls {stage_stats['ms_per_request']:>9.3f} ms/request")
+
+def compare(results, baseline_path):
+    """
+    Prints the relative change of the main numbers against an earlier run
+    and returns the worst latency regression in percent.
+    """
+    baseline = json.loads(Path(baseline_path).read_text())
+    print(f"\nchange against {baseline_path} ({baseline.get('commit')}, {baseline.get('started')})")
+    worst = 0
+    for name, stats in results['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if not before:
+            continue
+        changes = []
+        for key in ('p50', 'p95', 'p99', ):
+            old, new = before['latency_ms'][key], stats['latency_ms'][key]
+            change = (new - old) / old * 100 if old else 0
+            worst = max(worst, change)
+            changes.append(f'{key} {change:+.1f}%')
+        old, new = before['throughput_rps'], stats['throughput_rps']
+        changes.append(f'req/s {(new - old) / old * 100 if old else 0:+.1f}%')
+        print(f"{name:<8} {', '.join(changes)}")
+    return worst
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', action='append', choices=('page', 'static', 'visit', ), help='default: all')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=300, help='measured requests per scenario')
+    parser.add_argument('--live', action='store_true', help='serve the proxy over real sockets instead of the test client')
+    parser.add_argument('--render-mode', default='http', choices=('http', 'browser', 'auto', ))
+    parser.add_argument('--no-cache', action='store_true', help='disable the page, css and asset caches')
+    parser.add_argument('--upstream-latency', type=float, default=0, help='ms the stand-in upstream adds to every response')
+    parser.add_argument('--large-bytes', type=int, default=1024 * 1024, help='size of binaries and media served by the upstream')
+    parser.add_argument('--output', help=f'json file for the results, default: a new file in {RESULTS_DIR}')
+    parser.add_argument('--compare', metavar='BASELINE', help='json results of an earlier run')
+    parser.add_argument('--max-regression', type=float, help='exit with status 1 if a latency percentile got worse by more percent')
+    options = parser.parse_args(argv)
+
+    upstream_process, upstream_url = start_upstream(options)
+    with tempfile.TemporaryDirectory(prefix='proxy-benchmark-') as work_dir:
+        setup_django(Path(work_dir), options)
+        from django.contrib.auth.models import User
+        from app.counters import traffic_counter
+        from app.models import Site
+
+        user = User.objects.create_user('benchmark')
+        Site.objects.create(user=user, name=SITE_NAME, url=upstream_url, render_mode=options.render_mode)
+
+        stages = Stages()
+        transport = (LiveServerTransport if options.live else TestClientTransport)(user, stages)
+        try:
+            pages = page_paths(upstream_url)
+            assets = asset_paths(transport, upstream_url, pages)
+            scenarios = {
+                'page':   (transport, pages),
+                'static': (transport, [path for page in pages for path in assets[page]]),
+                'visit':  (VisitTransport(transport, assets), pages),
+            }
+            results = {
+                'started':   datetime.datetime.now().isoformat(timespec='seconds'),
+                'commit':    git_commit(),
+                'python':    platform.python_version(),
+                'options':   vars(options),
+                'scenarios': {},
+            }
+            for name in options.scenario or scenarios:
+                scenario_transport, paths = scenarios[name]
+                results['scenarios'][name] = run_scenario(scenario_transport, stages, paths, options)
+        finally:
+            transport.close()
+            upstream_process.terminate()
+            traffic_counter.stop() # the database goes away with the directory
+
+    print_results(results)
+    output = Path(options.output) if options.output else RESULTS_DIR / f"proxy-{results['started'].replace(':', '')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f'\nsaved to {output}')
+
+    if options.compare:
+        worst = compare(results, options.compare)
+        if options.max_regression is not None and worst > options.max_regression:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Throughput of the html rewriters (app.rewriter) over the fixture pages.
+
+    python -m benchmarks.rewrite
+    python -m benchmarks.rewrite --backend stream --backend bs4 --repeat 50 --scale 200
+
+Every backend is also checked against `baseline_rewrite`, the loop
+ProxyView ran before the rewriter module existed. The 'bs4' output has to
+be byte for byte equal to it, the 'stream' output once parsed and
+serialized by BeautifulSoup, as it keeps the source document as is. Exits
+with status 1 on a mismatch. The expected output of the fixture pages is
+also kept in `fixtures/golden/`, for app.tests.
+"""
+import argparse
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from urllib.parse import urlparse
+
+from bs4 import BeautifulSoup
+
+from app.rewriter import REWRITERS, UrlRewriter
+from app.utils import urlencode
+
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures' / 'pages'
+GOLDEN_DIR   = Path(__file__).resolve().parent / 'fixtures' / 'golden'
+SITE_NAME    = 'example'
+SITE_URL     = 'https://example.com'
+
+
+def load_pages(scale):
+    pages = {path.stem: path.read_text() for path in sorted(FIXTURES_DIR.glob('*.html'))}
+    # heavy page, the listing with its cards repeated `scale` times
+    listing = pages['listing']
+    cards = ''.join(re.findall(r'<div class="card">.*?</div>\n', listing))
+    pages[f'listing_x{scale}'] = listing.replace(cards, cards * scale)
+    return pages
+
+def baseline_rewrite(html_content, name, site_url):
+    # ProxyView.get before app.rewriter, kept as it was
+    parsed_site_url = urlparse(site_url)
+    host = parsed_site_url.netloc
+    host_with_protocol = '{url.scheme}://{url.netloc}'.format(url=parsed_site_url)
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    for tag in soup.find_all(['a', 'script', 'link', 'meta', 'img',]):
+        new_path_chunk = f'/{name}/'
+        if tag.name != 'a':
+            new_path_chunk = '/static_proxy' + new_path_chunk
+        for tag_attr in ['href', 'src', 'content', 'data-src',]:
+            if tag_attr in tag.attrs:
+                old_tag_attr_val = tag.get(tag_attr, '')
+                if old_tag_attr_val.startswith('/'):
+                    tag[tag_attr] = new_path_chunk + urlencode(host_with_protocol + old_tag_attr_val)
+                elif host in old_tag_attr_val:
+                    tag[tag_attr] = new_path_chunk + urlencode(old_tag_attr_val)
+
+        if tag.get('srcset'):
+            tags_attr_chunks = []
+            new_path_chunk = f'/static_proxy/{name}/'
+            for tag_attr_chunk_val in tag['srcset'].split(' '):
+                if tag_attr_chunk_val.startswith('/'):
+                    tag_attr_chunk_val = new_path_chunk + urlencode(f"{host_with_protocol}{tag_attr_chunk_val}")
+                elif host in tag_attr_chunk_val:
+                    tag_attr_chunk_val = new_path_chunk + urlencode(tag_attr_chunk_val)
+                tags_attr_chunks.append(tag_attr_chunk_val)
+            tag['srcset'] = " ".join(tags_attr_chunks)
+
+    return str(soup)
+
+def normalized(html_content):
+    return str(BeautifulSoup(html_content, 'html.parser'))
+
+def rewrite(backend, html_content):
+    output = REWRITERS[backend](html_content, UrlRewriter(SITE_NAME, SITE_URL, tokens=False))
+    return normalized(output) if backend == 'stream' else output
+
+def check(backend, html_content, reference):
+    return rewrite(backend, html_content) == reference
+
+def measure(backend, html_content, repeat):
+    rewrite = REWRITERS[backend]
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rewrite(html_content, UrlRewriter(SITE_NAME, SITE_URL, tokens=False))
+        timings.append(time.perf_counter() - started)
+    return timings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', action='append', choices=list(REWRITERS), help='default: all')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--scale', type=int, default=100, help='repetitions of the listing cards in the heavy page')
+    args = parser.parse_args(argv)
+
+    backends = args.backend or list(REWRITERS)
+    pages = load_pages(args.scale)
+    failed = False
+
+    print(f"{'page':<16} {'size KB':>8} {'backend':<8} {'median ms':>10} {'MB/s':>8}  equivalent")
+    for page_name, html_content in pages.items():
+        reference = baseline_rewrite(html_content, SITE_NAME, SITE_URL)
+        size = len(html_content.encode())
+        for backend in backends:
+            equivalent = check(backend, html_content, reference)
+            failed = failed or not equivalent
+            median = statistics.median(measure(backend, html_content, args.repeat))
+            print(
+                f'{page_name:<16} {size / 1000:>8.1f} {backend:<8} '
+                f'{median * 1000:>10.2f} {size / median / 1e6:>8.2f}  {"yes" if equivalent else "NO"}'
+            )
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
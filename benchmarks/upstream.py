@@ -0,0 +1,151 @@
+"""
+Local stand-in for the upstream sites the proxy is benchmarked against.
+
+    python -m benchmarks.upstream --port 8765
+
+Serves the fixture pages plus a generated fan-out page (the article for
+any other html path), and fabricates every asset they link to from the
+path alone: stylesheets full of url() references, images, scripts, fonts
+and large binaries, with byte ranges for seeking. Nothing leaves the machine, so results only depend on
+the proxy.
+"""
+import argparse
+import hashlib
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+FIXTURES_DIR = Path(__file__).resolve().parent / 'fixtures' / 'pages'
+
+CONTENT_TYPES = {
+    'html':  'text/html; charset=utf-8',
+    'css':   'text/css; charset=utf-8',
+    'js':    'application/javascript',
+    'png':   'image/png',
+    'jpg':   'image/jpeg',
+    'webp':  'image/webp',
+    'woff2': 'font/woff2',
+    'mp4':   'video/mp4',
+    'bin':   'application/octet-stream',
+}
+
+
+def fanout_page(images, stylesheets):
+    # a page the size of a typical landing page: many images with srcset,
+    # several stylesheets and a couple of large downloads
+    cards = ''.join(
+        f'<div class="card"><a href="/item/{i}/"><img src="/img/fanout/{i}.jpg" '
+        f'srcset="/img/fanout/{i}.jpg 1x, /img/fanout/{i}@2x.jpg 2x, /img/fanout/{i}.webp 800w" alt="item {i}"></a>'
+        f'<p>Item {i} description with some text to make the page realistic.</p></div>\n'
+        for i in range(images)
+    )
+    links = ''.join(f'<link rel="stylesheet" href="/css/fanout-{i}.css">\n' for i in range(stylesheets))
+    return (
+        '<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Fan-out</title>\n'
+        f'{links}<script src="/js/app.js" defer></script></head>\n'
+        f'<body><main>{cards}</main>'
+        '<a href="/downloads/archive.bin">archive</a><video src="/media/intro.mp4"></video>'
+        '</body></html>\n'
+    )
+
+def stylesheet(path, urls):
+    rules = ''.join(
+        f'.{Path(path).stem}-{i} {{ background: url("../img/css/{i}.png") no-repeat; }}\n'
+        for i in range(urls)
+    )
+    return f'@import "/css/base.css";\n@font-face {{ src: url(/fonts/inter.woff2) format("woff2"); }}\n{rules}'
+
+def binary(path, size):
+    # deterministic bytes, so the asset cache sees stable content per path
+    block = hashlib.sha256(path.encode()).digest() * 256
+    return (block * (size // len(block) + 1))[:size]
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version        = 'HTTP/1.1' # keep-alive, like real upstream servers
+    disable_nagle_algorithm = True       # headers and body are separate writes
+    options                 = None       # argparse namespace, set by serve()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.options.latency:
+            time.sleep(self.options.latency / 1000)
+
+        path = self.path.split('?')[0]
+        extension = path.rsplit('.', 1)[-1] if '.' in path.rsplit('/', 1)[-1] else 'html'
+        body = self.body(path, extension)
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        byte_range = self.byte_range(len(body), etag) if extension != 'html' else None
+        self.send_response(206 if byte_range else 200)
+        self.send_header('Content-Type', CONTENT_TYPES.get(extension, 'application/octet-stream'))
+        if byte_range:
+            first, last = byte_range
+            self.send_header('Content-Range', f'bytes {first}-{last}/{len(body)}')
+            body = body[first:last + 1]
+        self.send_header('Content-Length', str(len(body)))
+        if extension != 'html':
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Cache-Control', f'max-age={self.options.max_age}')
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def byte_range(self, size, etag):
+        # single "bytes=first-last" ranges, like media players ask for when seeking
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if not match or self.headers.get('If-Range', etag) != etag or int(match.group(1)) >= size:
+            return None
+        first = int(match.group(1))
+        last = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+        return (first, last) if first <= last else None
+
+    def body(self, path, extension):
+        options = self.options
+        if extension == 'html':
+            page = path.strip('/').removesuffix('.html') or 'fanout'
+            if page == 'fanout':
+                return fanout_page(options.images, options.stylesheets).encode()
+            page_path = FIXTURES_DIR / f'{page}.html'
+            if not page_path.is_file(): # any other page of the site, e.g. the canonical url of the article
+                page_path = FIXTURES_DIR / 'article.html'
+            return page_path.read_bytes()
+        if extension == 'css':
+            return stylesheet(path, options.css_urls).encode()
+        if extension == 'js':
+            return b'document.documentElement.dataset.ready = "1";\n' * 200
+        if extension in ('bin', 'mp4', ):
+            return binary(path, options.large_bytes)
+        return binary(path, options.asset_bytes)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0, help='ms added to every response')
+    parser.add_argument('--images', type=int, default=60, help='images on the fan-out page')
+    parser.add_argument('--stylesheets', type=int, default=4, help='stylesheets on the fan-out page')
+    parser.add_argument('--css-urls', type=int, default=50, help='url() references per stylesheet')
+    parser.add_argument('--asset-bytes', type=int, default=20 * 1024, help='size of images, fonts and other assets')
+    parser.add_argument('--large-bytes', type=int, default=5 * 1024 * 1024, help='size of binaries and media')
+    parser.add_argument('--max-age', type=int, default=3600, help='Cache-Control max-age of assets')
+    return parser
+
+def serve(options, ready=None):
+    handler = type('Handler', (UpstreamHandler, ), {'options': options})
+    server = ThreadingHTTPServer((options.host, options.port), handler)
+    server.daemon_threads = True
+    if ready is not None:
+        ready.set()
+    server.serve_forever()
+
+def main(argv=None):
+    serve(build_parser().parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
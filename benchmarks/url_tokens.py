@@ -0,0 +1,127 @@
+"""
+Size and rewrite time of pages with percent-encoded proxy urls (the
+default) against pages with url tokens (PROXY_URL_TOKENS=True).
+
+    python -m benchmarks.url_tokens
+    python -m benchmarks.url_tokens --backend bs4 --repeat 50 --scale 200
+
+Pages are the fixture pages plus the fan-out page of the stand-in upstream
+(benchmarks.upstream). The rewrite with tokens is timed cold, with an empty
+token table, and warm, when the page was rewritten before. Every token of
+the output is decoded back and the page compared to the encoded one, exits
+with status 1 on a mismatch.
+"""
+import argparse
+import gzip
+import re
+import statistics
+import sys
+import time
+
+import django
+from django.conf import settings
+
+
+SITE_NAME = 'example'
+SITE_URL  = 'https://example.com'
+TOKEN_RE  = re.compile(rf'(/(?:static_proxy/)?{SITE_NAME}/)(~[\w-]+)')
+
+
+def setup_django(token_memory_size):
+    settings.configure(
+        SECRET_KEY='benchmark',
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'OPTIONS': {'MAX_ENTRIES': 10 ** 6}}},
+        PROXY_URL_TOKENS=False,
+        PROXY_URL_TOKEN_MEMORY_SIZE=token_memory_size,
+        PROXY_URL_TOKEN_TTL=3600,
+    )
+    django.setup()
+
+def load_pages(scale):
+    from benchmarks.rewrite import load_pages as load_fixture_pages
+    from benchmarks.upstream import fanout_page
+
+    pages = load_fixture_pages(scale)
+    pages['fanout'] = fanout_page(images=60, stylesheets=4)
+    return pages
+
+def rewrite(backend, html_content, tokens):
+    from app.rewriter import REWRITERS, UrlRewriter
+    from app.url_tokens import flush_url_tokens
+
+    rewritten = REWRITERS[backend](html_content, UrlRewriter(SITE_NAME, SITE_URL, tokens=tokens))
+    if tokens:
+        flush_url_tokens()
+    return rewritten
+
+def timed(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+def detokenized(html_content):
+    from app.url_tokens import decode_url
+    from app.utils import urlencode
+
+    return TOKEN_RE.sub(lambda match: match.group(1) + urlencode(decode_url(match.group(2)) or ''), html_content)
+
+def cold_rewrite_time(backend, html_content, repeat):
+    # every token is new: an empty table in memory and in the shared cache
+    from django.core.cache import cache
+    from app.url_tokens import get_url_tokens
+
+    timings = []
+    for _ in range(repeat):
+        get_url_tokens()._urls.clear()
+        cache.clear()
+        started = time.perf_counter()
+        rewrite(backend, html_content, tokens=True)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', default='stream', choices=('stream', 'bs4', ))
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--scale', type=int, default=100, help='repetitions of the listing cards in the heavy page')
+    parser.add_argument('--token-memory-size', type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    setup_django(args.token_memory_size)
+    failed = False
+
+    print(
+        f"{'page':<12} {'urls':>5} {'encoded KB':>10} {'tokens KB':>9} {'gzip':>13} "
+        f"{'encoded ms':>10} {'cold ms':>8} {'warm ms':>8}  equivalent"
+    )
+    for page_name, html_content in load_pages(args.scale).items():
+        encoded = rewrite(args.backend, html_content, tokens=False)
+        tokenized = rewrite(args.backend, html_content, tokens=True)
+        equivalent = detokenized(tokenized) == encoded
+        failed = failed or not equivalent
+
+        encoded_ms = timed(lambda: rewrite(args.backend, html_content, tokens=False), args.repeat) * 1000
+        cold_ms = cold_rewrite_time(args.backend, html_content, args.repeat) * 1000
+        warm_ms = timed(lambda: rewrite(args.backend, html_content, tokens=True), args.repeat) * 1000
+        encoded_gzip, tokens_gzip = len(gzip.compress(encoded.encode())), len(gzip.compress(tokenized.encode()))
+        print(
+            f'{page_name:<12} {len(TOKEN_RE.findall(tokenized)):>5} '
+            f'{len(encoded.encode()) / 1000:>10.1f} {len(tokenized.encode()) / 1000:>9.1f} '
+            f'{encoded_gzip / 1000:>6.1f}/{tokens_gzip / 1000:<6.1f} '
+            f'{encoded_ms:>10.2f} {cold_ms:>8.2f} {warm_ms:>8.2f}  {"yes" if equivalent else "NO"}'
+        )
+
+    from app.url_tokens import decode_url, encode_url
+    urls = [f'{SITE_URL}/img/fanout/{i}.jpg?width={i % 7 * 100}' for i in range(10_000)]
+    encode_us = timed(lambda: [encode_url(url) for url in urls], 3) / len(urls) * 1e6
+    tokens = [encode_url(url) for url in urls]
+    decode_us = timed(lambda: [decode_url(token) for token in tokens], 3) / len(tokens) * 1e6
+    print(f'\nencode {encode_us:.2f} us, decode {decode_us:.2f} us per url (in memory)')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,5 +3,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'free_vpn.settings')
+os.environ.setdefault('PROXY_ASYNC_VIEWS', 'True') # serve the proxy with the async views
 
 application = get_asgi_application()
@@ -68,6 +68,16 @@ DATABASES = {
     'default':  dj_database_url.config(default=DATABASE_URL)
 }
 
+CACHES = {
+    'default': {
+        **env.cache('CACHE_URL', default=f'filecache://{BASE_DIR / ".cache" / "django"}'),
+        'TIMEOUT': env.int('CACHE_TIMEOUT', 300),
+        'OPTIONS': {
+            'MAX_ENTRIES': env.int('CACHE_MAX_ENTRIES', 1000),
+        },
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -99,3 +109,79 @@ STATIC_URL = 'static/'
 STATIC_ROOT = Path.joinpath(BASE_DIR, STATIC_URL)
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Proxy
+
+PROXY_DRIVER_POOL_SIZE     = env.int('PROXY_DRIVER_POOL_SIZE', 2)       # max chrome sessions per process
+PROXY_DRIVER_POOL_MAX_USES = env.int('PROXY_DRIVER_POOL_MAX_USES', 50)  # recycle a session after this many renders
+PROXY_DRIVER_POOL_TIMEOUT  = env.float('PROXY_DRIVER_POOL_TIMEOUT', 30) # seconds to wait for a free session
+PROXY_DRIVER_POOL_WARM     = env.bool('PROXY_DRIVER_POOL_WARM', True)   # start all sessions on first use
+
+PROXY_RENDER_BACKEND       = env.str('PROXY_RENDER_BACKEND', 'inline')     # inline: render in the web process, queue: in manage.py run_render_workers
+PROXY_RENDER_WORKERS       = env.int('PROXY_RENDER_WORKERS', PROXY_DRIVER_POOL_SIZE) # renders in parallel per worker process
+PROXY_RENDER_QUEUE_DEPTH   = env.int('PROXY_RENDER_QUEUE_DEPTH', 20)       # pending renders, more are answered with "busy"
+PROXY_RENDER_TIMEOUT       = env.float('PROXY_RENDER_TIMEOUT', 60)         # seconds a web worker waits for a queued render
+PROXY_RENDER_POLL_INTERVAL = env.float('PROXY_RENDER_POLL_INTERVAL', 0.1)  # seconds between checks for a finished render
+PROXY_RENDER_JOB_RETENTION = env.int('PROXY_RENDER_JOB_RETENTION', 3600)   # seconds finished jobs are kept
+
+PROXY_PAGE_CACHE_TTL = env.int('PROXY_PAGE_CACHE_TTL', 300) # seconds a rewritten page is served from cache
+PROXY_SITE_RESOLVER_SIZE = env.int('PROXY_SITE_RESOLVER_SIZE', 1024) # sites kept in memory per process by name
+PROXY_ASSET_PASS_COOKIE  = env.str('PROXY_ASSET_PASS_COOKIE', 'proxy_asset_pass') # signed cookie that lets static_proxy skip the session
+PROXY_ASSET_PASS_TTL     = env.int('PROXY_ASSET_PASS_TTL', 30 * 60)                # seconds, a logged out user keeps asset access that long at most
+
+PROXY_COALESCE_PAGE_TIMEOUT  = env.float('PROXY_COALESCE_PAGE_TIMEOUT', 60)          # seconds a request waits for an identical render in flight
+PROXY_COALESCE_ASSET_TIMEOUT = env.float('PROXY_COALESCE_ASSET_TIMEOUT', 30)         # seconds a request waits for an identical asset fetch in flight
+PROXY_COALESCE_MAX_BYTES     = env.int('PROXY_COALESCE_MAX_BYTES', 2 * 1024 * 1024) # larger assets are streamed to each request separately
+
+PROXY_UPSTREAM_POOL_SIZE       = env.int('PROXY_UPSTREAM_POOL_SIZE', 10)         # keep-alive connections per upstream host
+PROXY_UPSTREAM_MAX_HOSTS       = env.int('PROXY_UPSTREAM_MAX_HOSTS', 100)        # upstream hosts with a warm session
+PROXY_UPSTREAM_CONNECT_TIMEOUT = env.float('PROXY_UPSTREAM_CONNECT_TIMEOUT', 5)  # seconds
+PROXY_UPSTREAM_READ_TIMEOUT    = env.float('PROXY_UPSTREAM_READ_TIMEOUT', 30)    # seconds
+PROXY_UPSTREAM_RETRIES         = env.int('PROXY_UPSTREAM_RETRIES', 2)            # retries of failed GET requests
+PROXY_UPSTREAM_BACKOFF         = env.float('PROXY_UPSTREAM_BACKOFF', 0.3)        # retry backoff factor in seconds
+
+PROXY_ASSET_CACHE_ENABLED           = env.bool('PROXY_ASSET_CACHE_ENABLED', True)
+PROXY_ASSET_CACHE_DIR               = env.str('PROXY_ASSET_CACHE_DIR', str(BASE_DIR / '.cache' / 'assets'))
+PROXY_ASSET_CACHE_MAX_BYTES         = env.int('PROXY_ASSET_CACHE_MAX_BYTES', 512 * 1024 * 1024)       # quota of stored bodies
+PROXY_ASSET_CACHE_MAX_OBJECT_BYTES  = env.int('PROXY_ASSET_CACHE_MAX_OBJECT_BYTES', 32 * 1024 * 1024) # larger bodies are only streamed
+PROXY_ASSET_CACHE_MAX_HEURISTIC_AGE = env.int('PROXY_ASSET_CACHE_MAX_HEURISTIC_AGE', 24 * 60 * 60) # seconds, for responses without explicit expiry
+
+PROXY_HTML_REWRITER = env.str('PROXY_HTML_REWRITER', 'stream') # one of: stream, bs4
+
+PROXY_URL_TOKENS            = env.bool('PROXY_URL_TOKENS', False)              # short signed tokens instead of encoded urls in rewritten pages
+PROXY_URL_TOKEN_MEMORY_SIZE = env.int('PROXY_URL_TOKEN_MEMORY_SIZE', 100_000) # tokens kept in memory per process
+PROXY_URL_TOKEN_TTL         = env.int('PROXY_URL_TOKEN_TTL', 7 * 24 * 60 * 60) # seconds tokens are kept in the shared cache, must outlive cached pages
+
+PROXY_CSS_CACHE_TTL       = env.int('PROXY_CSS_CACHE_TTL', 24 * 60 * 60)      # seconds a rewritten stylesheet is kept
+PROXY_CSS_CACHE_MAX_BYTES = env.int('PROXY_CSS_CACHE_MAX_BYTES', 2 * 1024 * 1024) # larger stylesheets are rewritten on every request
+
+PROXY_COMPRESS_MIN_BYTES = env.int('PROXY_COMPRESS_MIN_BYTES', 1024) # smaller html and css responses are sent uncompressed
+PROXY_GZIP_LEVEL         = env.int('PROXY_GZIP_LEVEL', 6)
+PROXY_BROTLI_QUALITY     = env.int('PROXY_BROTLI_QUALITY', 5)         # brotli is used when the brotli package is installed
+
+PROXY_COUNTER_FLUSH_INTERVAL = env.float('PROXY_COUNTER_FLUSH_INTERVAL', 5) # seconds between writes of visit and traffic counters, 0 writes at once
+
+PROXY_ASYNC_VIEWS                    = env.bool('PROXY_ASYNC_VIEWS', False)              # set by asgi.py
+PROXY_UPSTREAM_ASYNC_MAX_CONNECTIONS = env.int('PROXY_UPSTREAM_ASYNC_MAX_CONNECTIONS', 500) # per event loop, with httpx installed
+
+PROXY_READY_TIMEOUTS = { # seconds a browser render waits per ready strategy, the page is taken as is after that
+    'dom':          env.float('PROXY_READY_TIMEOUT_DOM', 10),
+    'load':         env.float('PROXY_READY_TIMEOUT_LOAD', 15),
+    'network_idle': env.float('PROXY_READY_TIMEOUT_NETWORK_IDLE', 20),
+    'selector':     env.float('PROXY_READY_TIMEOUT_SELECTOR', 10),
+}
+PROXY_NETWORK_IDLE_MS = env.int('PROXY_NETWORK_IDLE_MS', 500) # quiet time without in-flight requests for the network idle strategy
+
+PROXY_BLOCKED_TRACKER_DOMAINS = env.list('PROXY_BLOCKED_TRACKER_DOMAINS', default=[ # not loaded by the browser for sites that block trackers
+    'google-analytics.com', 'googletagmanager.com', 'doubleclick.net', 'googlesyndication.com',
+    'connect.facebook.net', 'mc.yandex.ru', 'hotjar.com', 'segment.io', 'scorecardresearch.com',
+])
+
+PROXY_WARM_TOP_SITES    = env.int('PROXY_WARM_TOP_SITES', 20)                      # sites warmed by manage.py warm_proxy
+PROXY_WARM_WORKERS      = env.int('PROXY_WARM_WORKERS', PROXY_DRIVER_POOL_SIZE)    # sites warmed in parallel
+PROXY_WARM_MAX_ASSETS   = env.int('PROXY_WARM_MAX_ASSETS', 50)                     # assets fetched per warmed site
+PROXY_WARM_LOCK_TIMEOUT = env.int('PROXY_WARM_LOCK_TIMEOUT', 30 * 60)              # seconds, after that a crashed run stops blocking others
+
+# Site list
+
+SITES_COUNT_LIMIT = env.int('SITES_COUNT_LIMIT', 1000) # sites counted at most for the site list, more are shown as "1000+"
@@ -5,4 +5,7 @@ set -ex # fail on any error and enable print of debug logs
 
 python manage.py migrate # Migrate DB
 python manage.py collectstatic --noinput # Collect static
+if [ "${PROXY_WARM_ON_START:-False}" = "True" ]; then
+    python manage.py warm_proxy & # Warm proxy caches in background, never blocks the start
+fi
 python manage.py runserver 0.0.0.0:8005 # Run application